@@ -20,25 +20,15 @@ Convert a graph in Json Graph Streaming format to a dynamic GEXF graph.
 Usage: json2gexf.py json_file gexf_file 
 '''
 
-try:
-    import json
-except ImportError:
-    try:
-        import simplejson as json
-    except:
-        raise "Requires either simplejson or Python 2.6!"
-
 import gexf
 import sys
+from pygephi import GraphStreamReader
 
 xml = gexf.Gexf("pygephi - Graph Streaming","https://github.com/panisson/pygephi_graphstreaming")
 graph = xml.addGraph("undirected","dynamic","a Json generated graph")
 
 json_file_name = sys.argv[-2]
-json_file = open(json_file_name)
-file_content = json_file.read()
-
-event_types = set(['an','cn', 'dn', 'ae', 'ce', 'de'])
+json_file = open(json_file_name, 'rb')
 
 node_properties = set(['label', 'r', 'g', 'b'])
 edge_properties = set(['source', 'target', 'directed', 'label', 'r', 'g', 'b'])
@@ -103,36 +93,29 @@ def delete_edge(id, t):
     edge = graph.edges[id]
     edge.spells[-1]['end'] = str(t)
     
-for line in file_content.split('\r'):
-    line = line.strip()
-    if len(line) == 0: continue
-    event = json.loads(line)
+for event in GraphStreamReader(json_file):
     
-    event_type = event_types.intersection(event.keys()).pop()
-    t = event['t']
+    event_type = event.type
+    t = event.t
     
     if event_type == 'an':
-        for k, v in event['an'].iteritems():
-            add_node(k, t, v)
+        add_node(event.id, t, event.attributes)
     elif event_type == 'cn':
-        for k, v in event['cn'].iteritems():
-            change_node(k, t, v)
+        change_node(event.id, t, event.attributes)
     elif event_type == 'dn':
-        for k, v in event['dn'].iteritems():
-            delete_node(k, t)
+        if event.id is not None:
+            delete_node(event.id, t)
             
     elif event_type == 'ae':
-        for k, v in event['ae'].iteritems():
-            source = v.pop('source')
-            target = v.pop('target')
-            directed = v.pop('directed') if 'directed' in v else False 
-            add_edge(k, source, target, directed, t, v)
+        v = event.attributes
+        source = v.pop('source')
+        target = v.pop('target')
+        directed = v.pop('directed') if 'directed' in v else False 
+        add_edge(event.id, source, target, directed, t, v)
     elif event_type == 'ce':
-        for k, v in event['ce'].iteritems():
-            change_edge(k, t, v)
+        change_edge(event.id, t, event.attributes)
     elif event_type == 'de':
-        for k, v in event['de'].iteritems():
-            delete_edge(k, t)
+        delete_edge(event.id, t)
 
 gexf_file_name = json_file_name = sys.argv[-1]
 gexf_file = file(gexf_file_name, 'w')
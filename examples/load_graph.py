@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+'''
+Load a static graph file into a Gephi workspace, in large batches.
+
+Use this script with Gephi and Graph Streaming plugin.
+1. Open Gephi, create a new project
+2. Go to the tab Streaming, right-click on "Master Server", click on "Start"
+3. Run this script with the graph file
+
+Usage: load_graph.py [options] graph_file
+
+Options:
+  -h, --help            show this help message and exit
+  -u URL, --url=URL     URL of the Gephi workspace
+  -f FORMAT, --format=FORMAT
+                        File format: gexf, csv or edgelist (guessed from the
+                        file extension by default)
+  -n FILE, --nodes=FILE CSV file with the nodes of a csv graph
+  --delimiter=CHAR      Delimiter of csv files
+  --directed            Load the edges as directed unless the file says otherwise
+  --undirected          Load the edges as undirected unless the file says otherwise
+                        (by default, gexf edges are undirected and others directed)
+  --batch_bytes=BYTES   Approximate size of each event
+  --flush_bytes=BYTES   Approximate size of each request sent to Gephi
+  -r N, --retries=N     Retries of a failed request
+  -c, --clean           Delete the graph of the workspace before loading
+'''
+
+import optparse
+import os
+import sys
+from pygephi import GephiClient, BulkLoader
+from pygephi.loader import READERS
+
+EXTENSIONS = {'.gexf': 'gexf', '.csv': 'csv', '.txt': 'edgelist', '.edges': 'edgelist'}
+
+def parseOptions():
+    parser = optparse.OptionParser(usage="usage: %prog [options] graph_file")
+    parser.add_option("-u", "--url", type="string", dest="url", help="URL of the Gephi workspace", default="http://localhost:8080/workspace0")
+    parser.add_option("-f", "--format", type="choice", choices=READERS.keys(), dest="format", help="File format: gexf, csv or edgelist (guessed from the file extension by default)", default=None)
+    parser.add_option("-n", "--nodes", type="string", dest="nodes", help="CSV file with the nodes of a csv graph", default=None)
+    parser.add_option("--delimiter", type="string", dest="delimiter", help="Delimiter of csv files", default=",")
+    parser.add_option("--directed", action="store_true", dest="directed", help="Load the edges as directed unless the file says otherwise", default=None)
+    parser.add_option("--undirected", action="store_false", dest="directed", help="Load the edges as undirected unless the file says otherwise (by default, gexf edges are undirected and others directed)")
+    parser.add_option("--batch_bytes", type="int", dest="batch_bytes", help="Approximate size of each event", default=64*1024)
+    parser.add_option("--flush_bytes", type="int", dest="flush_bytes", help="Approximate size of each request sent to Gephi", default=1024*1024)
+    parser.add_option("-r", "--retries", type="int", dest="retries", help="Retries of a failed request", default=3)
+    parser.add_option("-c", "--clean", action="store_true", dest="clean", help="Delete the graph of the workspace before loading", default=False)
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("A graph file is mandatory")
+    if options.format is None:
+        options.format = EXTENSIONS.get(os.path.splitext(args[0])[1].lower())
+        if options.format is None:
+            parser.error("Unknown file format, use --format")
+    return options, args[0]
+
+def progress(nodes, edges, seconds):
+    sys.stdout.write("\r%d nodes, %d edges in %.1fs (%d entities/s)" %
+                     (nodes, edges, seconds, (nodes + edges)/max(seconds, 1e-3)))
+    sys.stdout.flush()
+
+def main():
+    options, path = parseOptions()
+    client = GephiClient(options.url, retries=options.retries)
+    if options.clean:
+        client.clean()
+    if options.format == 'csv':
+        items = READERS['csv'](path, options.nodes, options.delimiter)
+    else:
+        items = READERS[options.format](path)
+    directed = options.directed
+    if directed is None:
+        directed = options.format != 'gexf'
+    loader = BulkLoader(client, options.batch_bytes, options.flush_bytes, directed, progress)
+    loader.load(items)
+    print
+    print "Loaded %d nodes and %d edges" % (loader.nodes, loader.edges)
+
+if __name__ == '__main__':
+    main()
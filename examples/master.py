@@ -23,6 +23,8 @@ the Graph Streaming plugin.
 1. Start Gephi
 2. Go to the tab Streaming,right-click on Client and click on "Connect to Stream"
 3. Enter the Source URL http://localhost:8181 and click OK
+    (add ?max_eps=N to receive at most N events per second, new edges
+    over this budget are dropped)
 
 The nodes and edges start to appear in the graph visualization. You can run
 the Force Atlas layout in order to get a better layout.
@@ -32,6 +34,10 @@ Usage: server.py -n 50 -p 8181
 Options:
   -n NR_NODES, --nr_nodes        maximum number of nodes
   -p PORT, --serverport=PORT     HTTP server port to listen
+  --max_latency=SECONDS          maximum seconds events are held to be written together
+                                 to a client (default 0.1, 0 writes each event at once)
+  --metrics                      serve queue depths, lag, throughput and drop counters
+                                 at http://localhost:8181/metrics
 
 Created on March 4, 2014
 
@@ -39,7 +45,8 @@ Created on March 4, 2014
 '''
 from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 from SocketServer import ThreadingMixIn
-from pygephi import GephiFileHandler
+from pygephi import GephiFileHandler, NodeRegistry, KnownNodes, RateLimiter, Metrics
+import urlparse
 import threading
 import Queue
 import socket
@@ -50,44 +57,81 @@ import random
 
 active_queues = []
 graph = {}
+registry = NodeRegistry()
+metrics = None
             
 def dispatch_event(e):
     # print e
+    now = time.time()
     for q in active_queues:
-        q.put(e)
+        q.put((now, e))
         
 class RequestProcessor():
     
-    def __init__(self, out):
-        self.known_nodes = {}
-        self.handler = GephiFileHandler(out)
+    def __init__(self, out, max_eps=None, metrics=None, metrics_labels=None, max_latency=None):
+        self.known_nodes = KnownNodes()
+        self.handler = GephiFileHandler(out, not max_latency, max_latency,
+                                        metrics=metrics, metrics_labels=metrics_labels)
+        self.limiter = None
+        self.sent_edges = None
+        self.dropped = 0
+        if max_eps:
+            self.limiter = RateLimiter(max_eps)
+            self.sent_edges = set()
     
     def process(self, event):
     
         etype = event['type']
         source = event['source']
         target = event['target']
+        eid = source + '_' + target
+        
+        if self.limiter is not None and not self.admit(etype, eid, source, target):
+            self.dropped += 1
+            return
             
         default_node_attr = {'size':5, 'r':84./255., 'g':148./255., 'b':183./255.}
             
-        if source not in self.known_nodes:
-            self.known_nodes[source] = source
+        if self.known_nodes.add(registry.intern(source)):
             attributes = default_node_attr.copy()
             attributes['label'] = source
             self.handler.add_node(source, **attributes)
             
-        if target not in self.known_nodes:
-            self.known_nodes[target] = target
+        if self.known_nodes.add(registry.intern(target)):
             attributes = default_node_attr.copy()
             attributes['label'] = target
             self.handler.add_node(target, **attributes)
         
-        eid = source + '_' + target
         if etype == 'ae':
             attributes = {'directed':True, 'weight':2.0}
             self.handler.add_edge(eid, source, target, **attributes)
         if etype == 'de':
             self.handler.delete_edge(eid)
+            
+    def flush(self):
+        self.handler.flush()
+            
+    def admit(self, etype, eid, source, target):
+        '''
+        Samples new edges, together with the nodes they add, while over the
+        event budget. Deletions are always sent, but only for the edges
+        that were sent.
+        '''
+        if etype == 'de':
+            if eid not in self.sent_edges:
+                return False
+            self.sent_edges.discard(eid)
+            self.limiter.consume()
+            return True
+        cost = 1
+        if registry.intern(source) not in self.known_nodes:
+            cost += 1
+        if registry.intern(target) not in self.known_nodes:
+            cost += 1
+        if not self.limiter.allow(cost):
+            return False
+        self.sent_edges.add(eid)
+        return True
 
 class RequestHandler(BaseHTTPRequestHandler):
         
@@ -96,30 +140,64 @@ class RequestHandler(BaseHTTPRequestHandler):
 
     def do_GET(self):
         
+        url = urlparse.urlparse(self.path)
+        if url.path == '/metrics':
+            self.send_metrics()
+            return
+        parameters = urlparse.parse_qs(url.query, keep_blank_values=False)
+        max_eps = None
+        if "max_eps" in parameters:
+            max_eps = float(parameters["max_eps"][0])
+        
         self.queue = Queue.Queue()
         active_queues.append(self.queue)
         
         self.wfile.write("HTTP/1.1 200 OK\nContent-Type: application/json\n\n")
         
-        request_processor = RequestProcessor(self.wfile)
-        
-        for source, target in graph:
-            event = {'type':'ae',
-                     'source':str(source),
-                     'target':str(target)}
-            request_processor.process(event)
+        labels = {'client': '%s:%s' % self.client_address}
+        request_processor = RequestProcessor(self.wfile, max_eps, metrics, labels,
+                                             self.server.max_latency)
+        lag = None
+        if metrics is not None:
+            metrics.gauge('pygephi_client_queue_depth', 'Events waiting to be sent to the client',
+                          function=self.queue.qsize, **labels)
+            metrics.gauge('pygephi_client_dropped', 'Edges dropped by the rate limit',
+                          function=lambda: request_processor.dropped, **labels)
+            lag = metrics.histogram('pygephi_client_lag_seconds',
+                                    'Time between dispatching an event and processing it', **labels)
         
-        while True:
-            
-            e = self.queue.get()
-            if e is None: break
+        try:
+            for source, target in graph:
+                event = {'type':'ae',
+                         'source':str(source),
+                         'target':str(target)}
+                request_processor.process(event)
+            request_processor.flush()
             
-            try:
+            while True:
+                
+                dispatched, e = self.queue.get()
+                if e is None: break
+                if lag is not None:
+                    lag.observe(time.time() - dispatched)
+                
                 request_processor.process(e)
-            except socket.error:
-                print "Connection closed"
-                active_queues.remove(self.queue)
-                return
+                if self.queue.empty():
+                    request_processor.flush()
+                
+        except socket.error:
+            print "Connection closed"
+        finally:
+            active_queues.remove(self.queue)
+            if metrics is not None:
+                metrics.remove(**labels)
+    
+    def send_metrics(self):
+        if metrics is None:
+            self.send_error(404, "Metrics are not enabled")
+            return
+        self.wfile.write("HTTP/1.1 200 OK\nContent-Type: text/plain; version=0.0.4\n\n")
+        self.wfile.write(metrics.render())
         
 class Producer(threading.Thread):
 
@@ -167,6 +245,8 @@ class Producer(threading.Thread):
 class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
     """Handle requests in a separate thread."""
     
+    max_latency = None
+    
     def start(self):
         self.serve_forever()
         
@@ -177,16 +257,23 @@ def parseOptions():
     parser = optparse.OptionParser()
     parser.add_option("-n", "--nr_nodes", type="int", dest="nr_nodes", help="Number of nodes", default=50)
     parser.add_option("-p", "--serverport", type="int", dest="serverport", help="HTTP server port", default=8181)
+    parser.add_option("--max_latency", type="float", dest="max_latency", help="Maximum seconds events are held to be written together to a client (0 writes each event at once)", default=0.1)
+    parser.add_option("--metrics", action="store_true", dest="metrics", help="Serve queue depths, lag, throughput and drop counters at /metrics", default=False)
     (options, _) = parser.parse_args()
     return options
         
 def main():
+    global metrics
     options = parseOptions()
+    if options.metrics:
+        metrics = Metrics()
+        metrics.gauge('pygephi_subscribers', 'Connected clients', function=lambda: len(active_queues))
     producer = Producer(options)
     producer.setDaemon(True)
     producer.start()
     try:
         server = ThreadedHTTPServer(('', options.serverport), RequestHandler)
+        server.max_latency = options.max_latency
         print 'Test server running...'
         server.start()
     except KeyboardInterrupt:
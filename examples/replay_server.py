@@ -21,9 +21,6 @@ collected from the Twitter Streaming API.
 It shows the Twitter data in Graph Streaming format,
 with the users as nodes and retweets as edges.
 
-You have to install the tweepy client (http://joshthecoder.github.com/tweepy/)
-in order to run this script.
-
 To connect to the server with Gephi, you must install Gephi with 
 the Graph Streaming plugin.
 
@@ -36,27 +33,47 @@ the Graph Streaming plugin.
 The nodes and edges start to appear in the graph visualization. You can run
 the Force Atlas layout in order to get a better layout.
 
+The following parameters can be added to the Source URL:
+  aggregate=1           Send one edge per pair of users, weighted by the number of retweets
+  ce_interval=SECONDS   Minimum interval between weight updates of an aggregated edge
+                        (default 1.0)
+  max_eps=N             Maximum number of events per second sent to the client. Pending
+                        weight changes are coalesced and new retweets dropped when over it
+  min_degree=N          Only send users with at least N retweets, and the retweets
+                        between them, as soon as they reach it
+
+When started with --metrics, the server also answers http://localhost:8181/metrics
+in the Prometheus text format.
+
 Usage: server.py [options]
 
 Options:
   -h, --help            show this help message and exit
   -l LOG, --log=LOG     Log file of collected streaming data
   -t tw, --timewarp=tw  Time warping factor, used to accelerate or slow down the replay
+                        (0 replays as fast as possible)
+  -m eps, --max_eps=eps Maximum number of events per second
   -d s, --delay=s       Starting delay in seconds
+  -s PORT, --serverport=PORT
+                        HTTP server port
+  --max_nodes=N         Maximum number of users kept, the least recently seen are deleted
+  --node_ttl=SECONDS    Delete users not seen for this many seconds of stream time
+  --window=SECONDS      Delete retweets older than this many seconds of stream time,
+                        and users left without retweets
+  --stats=SECONDS       Send degrees, PageRank and component of users every this many seconds
+  --max_latency=SECONDS Maximum seconds events are held to be written together to a client
+                        (default 0.1, 0 writes each event at once)
+  -v, --verbose         Print the text of replayed retweets
+  --metrics             Serve queue depths, lag, throughput and drop counters at /metrics
 
 @author: Andre Panisson
 '''
 from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 import urlparse
-import tweepy
 import re
-try:
-    import simplejson
-except ImportError:
-    try:
-        import json as simplejson
-    except:
-        raise "Requires either simplejson or Python 2.6!"
+from pygephi import GephiFileHandler, NodeRegistry, NodeEviction, KnownNodes
+from pygephi import SlidingWindow, Expiry, EdgeAggregator, RateLimiter
+from pygephi import DegreeFilter, GraphStats, StatsUpdate, Metrics
 import threading
 import Queue
 import socket
@@ -64,44 +81,292 @@ from SocketServer import ThreadingMixIn
 import optparse
 import sys
 import time
+import math
+import calendar
+from retweets import extract_retweet
 
 active_queues = []
+metrics = None
 
-class StreamingListener(tweepy.StreamListener):
+class Status(object):
     
-    def __init__(self, timewarp, *args, **kwargs):
-        tweepy.StreamListener.__init__(self, *args, **kwargs)
-        self.known_users = {}
-        self.before = None
+    def __init__(self, status_id, source, target, text, date):
+        self.status_id = status_id
+        self.source = source
+        self.target = target
+        self.text = text
+        self.date = date
+        self.source_index = None
+        self.target_index = None
+
+class TimewarpScheduler(object):
+    '''
+    Maps event timestamps to wall-clock deadlines measured from a fixed origin,
+    so that sleeping overhead never accumulates into drift. All events due
+    within the same tick are released together as one batch.
+    A timewarp of 0 replays as fast as possible, and max_eps, if set,
+    limits the number of events released per second.
+    '''
+    
+    def __init__(self, on_batch, timewarp=1.0, max_eps=None, tick=0.05, max_batch=1000):
+        self.on_batch = on_batch
         self.timewarp = timewarp
+        self.max_eps = max_eps
+        self.tick = tick
+        if max_eps:
+            max_batch = min(max_batch, max(1, int(max_eps*tick)))
+        self.max_batch = max_batch
+        self.origin = None
+        self.start = None
+        self.batch = []
+        self.batch_deadline = None
+        self.next_release = None
+        
+    def deadline(self, date):
+        if self.origin is None:
+            self.origin = date
+            self.start = time.time()
+        diff = date - self.origin
+        return self.start + diff.total_seconds()*self.timewarp
+    
+    def push(self, date, event):
+        deadline = self.deadline(date)
+        if self.batch and (deadline - self.batch_deadline > self.tick
+                           or len(self.batch) >= self.max_batch):
+            self.release()
+            # the release may have re-anchored the timeline
+            deadline = self.deadline(date)
+        if not self.batch:
+            self.batch_deadline = deadline
+        self.batch.append(event)
+        
+    def release(self):
+        if not self.batch:
+            return
+        target = self.batch_deadline
+        if self.max_eps and self.next_release is not None:
+            target = max(target, self.next_release)
+        now = time.time()
+        if target > now:
+            time.sleep(target - now)
+        elif target < now - self.tick:
+            # fell behind the timeline: re-anchor it at this batch, so that
+            # the following events keep their pace instead of catching up
+            # in a burst
+            self.start += now - self.batch_deadline
+            target = now
+        batch, self.batch = self.batch, []
+        if self.max_eps:
+            self.next_release = target + len(batch)/float(self.max_eps)
+        self.on_batch(batch)
+        
+    def finish(self):
+        self.release()
+
+def dispatch_event(e):
+    dispatch_batch([e])
+    
+def dispatch_batch(batch):
+    now = time.time()
+    for q in active_queues:
+        q.put((now, batch))
+
+def remove_stats(stats, edges, nodes):
+    for _, source, target in edges:
+        stats.remove_edge(source, target)
+    for node_id, _ in nodes:
+        stats.remove_node(node_id)
+        
+def stats_update(stats, registry):
+    '''
+    Collects the changed graph statistics, sizing users by their PageRank.
+    '''
+    nodes = []
+    for node_id, attributes in stats.changes().iteritems():
+        index = registry.index(node_id)
+        if index is not None:
+            attributes['size'] = 5.0*math.sqrt(max(1.0, attributes['pagerank']))
+            nodes.append((node_id, index, attributes))
+    return StatsUpdate(nodes)
+        
+class RequestProcessor():
     
-    def on_status(self, status):
-        print status.text
+    def __init__(self, parameters, out, windowed=False, metrics=None, metrics_labels=None,
+                 max_latency=None):
+        self.terms = parameters["q"][0].split(",")
+        self.known_users = KnownNodes()
+        self.sent_edges = set() if windowed else None
         
-        date = status.created_at
-        if not self.before:
-            self.before = date
+        self.aggregator = None
+        self.timeout = None
+        if "aggregate" in parameters:
+            self.timeout = float(parameters.get("ce_interval", ["1.0"])[0])
+            self.aggregator = EdgeAggregator(self.timeout)
+            self.last_flush = time.time()
             
-        if date > self.before:
-            diff = date - self.before
+        self.limiter = None
+        self.dropped = 0
+        if "max_eps" in parameters:
+            self.limiter = RateLimiter(float(parameters["max_eps"][0]))
             
-            sleeptime = diff.seconds + diff.microseconds*10e-6
-            if sleeptime > 0:
-                time.sleep(sleeptime*self.timewarp)
-            self.before = date
-        
-        m = re.search('(?<=RT\s@)\w+', status.text)
-        if m:
-            source_user = m.group(0).lower()
-            target_user = status.user.screen_name
-            id = status.id
-            text = status.text
+        self.degree_filter = None
+        if "min_degree" in parameters:
+            self.degree_filter = DegreeFilter(int(parameters["min_degree"][0]))
             
-            dispatch_event((id, source_user, target_user, text, date))
+        self.handler = GephiFileHandler(out, not max_latency, max_latency,
+                                        metrics=metrics, metrics_labels=metrics_labels)
+        
+    def process(self, status):
+        
+        if isinstance(status, NodeEviction):
+            self.delete_nodes(status.nodes)
+            return
+        if isinstance(status, Expiry):
+            self.expire(status)
+            return
+        if isinstance(status, StatsUpdate):
+            self.update_stats(status)
+            return
+        
+        found = False
+        for term in self.terms:
+            if re.search(term, status.text.lower()):
+                found = True
+                break
+        if not found:
+            return
+        
+        if self.degree_filter is None:
+            self.send_retweet(status)
+            return
+        
+        passed, released = self.degree_filter.add_edge(status.status_id, status.source,
+                                                       status.target, status)
+        for node_id in passed:
+            index = status.source_index if node_id == status.source else status.target_index
+            if self.send_node(node_id, index) and self.limiter is not None:
+                self.limiter.consume()
+        for retweet in released:
+            self.send_retweet(retweet)
+        return
             
-def dispatch_event(e):
-    for q in active_queues:
-        q.put(e)
+    def send_node(self, node_id, index):
+        if not self.known_users.add(index):
+            return False
+        attributes = {'size':5, 'r':84./255., 'g':148./255., 'b':183./255., 'label':node_id}
+        self.handler.add_node(node_id, **attributes)
+        return True
+        
+    def send_retweet(self, status):
+        if self.limiter is not None and not self.admit(status):
+            self.dropped += 1
+            return
+        
+        self.send_node(status.source, status.source_index)
+        self.send_node(status.target, status.target_index)
+        
+        if self.sent_edges is not None:
+            self.sent_edges.add(status.status_id)
+        if self.aggregator is None:
+            attributes = {'directed':True, 'weight':2.0, 'date':str(status.date)}
+            self.handler.add_edge(status.status_id, status.source, status.target, **attributes)
+        else:
+            self.aggregate(self.aggregator.add(status.source, status.target, time.time()),
+                           status.source, status.target)
+            
+    def admit(self, status):
+        '''
+        Takes a new retweet and the users it adds from the event budget.
+        Retweets of aggregated edges are always admitted, since their weight
+        changes are kept pending while over budget.
+        '''
+        if self.aggregator is not None and (status.source, status.target) in self.aggregator:
+            return True
+        cost = 1
+        if status.source_index not in self.known_users:
+            cost += 1
+        if status.target_index not in self.known_users:
+            cost += 1
+        return self.limiter.allow(cost)
+            
+    def aggregate(self, change, source, target):
+        operation, edge_id, weight = change
+        if operation == 'ce' and self.limiter is not None and not self.limiter.allow():
+            self.aggregator.postpone(source, target)
+            return
+        if operation == 'ae':
+            self.handler.add_edge(edge_id, source, target, directed=True, weight=float(weight), count=weight)
+        elif operation == 'ce':
+            self.handler.change_edge(edge_id, weight=float(weight), count=weight)
+        elif operation == 'de':
+            self.handler.delete_edge(edge_id)
+            if self.limiter is not None:
+                self.limiter.consume()
+            
+    def flush(self):
+        self.handler.flush()
+        
+    def tick(self):
+        '''
+        Sends the pending weight changes of aggregated edges every ce_interval seconds.
+        '''
+        if self.aggregator is None:
+            return
+        now = time.time()
+        if now - self.last_flush < self.timeout:
+            return
+        if self.limiter is not None and not self.limiter.allow(0):
+            return
+        self.last_flush = now
+        changes = self.aggregator.flush(now)
+        if changes:
+            if self.limiter is not None:
+                self.limiter.consume(len(changes))
+            self.handler.change_edges(dict((edge_id, {'weight':float(weight), 'count':weight})
+                                           for edge_id, weight in changes))
+            
+    def update_stats(self, update):
+        known_users = self.known_users
+        nodes = dict((node_id, attributes) for node_id, index, attributes in update.nodes
+                     if index in known_users)
+        if nodes:
+            self.handler.change_nodes(nodes)
+            if self.limiter is not None:
+                self.limiter.consume(len(nodes))
+            
+    def expire(self, expiry):
+        if self.degree_filter is not None:
+            for edge_id, _, _ in expiry.edges:
+                self.degree_filter.remove_edge(edge_id)
+        sent_edges = self.sent_edges
+        edges = [edge for edge in expiry.edges if edge[0] in sent_edges]
+        if self.aggregator is None:
+            edge_ids = [edge[0] for edge in edges]
+            if edge_ids:
+                sent_edges.difference_update(edge_ids)
+                self.handler.delete_edges(edge_ids)
+                if self.limiter is not None:
+                    self.limiter.consume(len(edge_ids))
+        else:
+            now = time.time()
+            for edge_id, source, target in edges:
+                sent_edges.discard(edge_id)
+                self.aggregate(self.aggregator.remove(source, target, now), source, target)
+        self.delete_nodes(expiry.nodes)
+        
+    def delete_nodes(self, nodes):
+        if self.degree_filter is not None:
+            for node_id, _ in nodes:
+                self.degree_filter.discard_node(node_id)
+        known_users = self.known_users
+        deleted = [node_id for node_id, index in nodes if known_users.discard(index)]
+        if deleted:
+            self.handler.delete_nodes(deleted)
+            if self.limiter is not None:
+                self.limiter.consume(len(deleted))
+            if self.aggregator is not None:
+                for node_id in deleted:
+                    self.aggregator.discard_node(node_id)
 
 class RequestHandler(BaseHTTPRequestHandler):
 
@@ -113,84 +378,149 @@ class RequestHandler(BaseHTTPRequestHandler):
 
     def do_GET(self):
         
-        param_str = urlparse.urlparse(self.path).query
-        parameters = urlparse.parse_qs(param_str, keep_blank_values=False)
+        url = urlparse.urlparse(self.path)
+        if url.path == '/metrics':
+            self.send_metrics()
+            return
+        parameters = urlparse.parse_qs(url.query, keep_blank_values=False)
         if "q" not in parameters:
             return
         
         q = parameters["q"][0]
-        terms = q.split(",")
         
         print "Request for retweets, query '%s'"%q
         
         self.queue = Queue.Queue()
-        self.known_users = {}
-        active_queues.append(self.queue)
         
         self.wfile.write('\r\n')
         
-        while True:
-                        
-            (id, source, target, text, date) = self.queue.get()
-            if id == None:
-                break
-            
-            found = False
-            for term in terms:
-                if re.search(term, text.lower()):
-                    found = True
-            if not found:
-                continue
-            
-            try:
-                
-                if source not in self.known_users:
-                    self.known_users[source] = source
-                    event = simplejson.dumps({'an':{source:{'label':source, 'size':5, 'r':84./255., 'g':148./255., 'b':183./255.}}})
-                    self.wfile.write(event)
-                    self.wfile.write('\r\n\r\n')
-                    
-                if target not in self.known_users:
-                    self.known_users[target] = target
-                    event = simplejson.dumps({'an':{target:{'label':target, 'size':5, 'r':84./255., 'g':148./255., 'b':183./255.}}})
-                    self.wfile.write(event)
-                    self.wfile.write('\r\n')
+        labels = {'client': '%s:%s' % self.client_address}
+        request_processor = RequestProcessor(parameters, self.wfile, self.server.windowed,
+                                             metrics, labels, self.server.max_latency)
+        lag = None
+        if metrics is not None:
+            metrics.gauge('pygephi_client_queue_depth', 'Batches waiting to be sent to the client',
+                          function=self.queue.qsize, **labels)
+            metrics.gauge('pygephi_client_dropped', 'Retweets dropped by the rate limit',
+                          function=lambda: request_processor.dropped, **labels)
+            lag = metrics.histogram('pygephi_client_lag_seconds',
+                                    'Time between dispatching a batch and processing it', **labels)
+        active_queues.append(self.queue)
+        
+        try:
+            while True:
                 
-                event = simplejson.dumps({'ae':{id:{'source':source, 'target':target, 'directed':True, 'weight':2.0, 'date':str(date)}}})
-                self.wfile.write(event)
-                self.wfile.write('\r\n')
+                try:
+                    dispatched, batch = self.queue.get(True, request_processor.timeout)
+                    if lag is not None:
+                        lag.observe(time.time() - dispatched)
+                except Queue.Empty:
+                    batch = ()
+                for status in batch:
+                    if status is None:
+                        request_processor.flush()
+                        return
+                    request_processor.process(status)
+                request_processor.tick()
+                if self.queue.empty():
+                    request_processor.flush()
                 
-            except socket.error:
-                print "Connection closed"
-                active_queues.remove(self.queue)
-                return
+        except socket.error:
+            print "Connection closed"
+        finally:
+            active_queues.remove(self.queue)
+            if metrics is not None:
+                metrics.remove(**labels)
+    
+    def send_metrics(self):
+        if metrics is None:
+            self.send_error(404, "Metrics are not enabled")
+            return
+        self.wfile.write("HTTP/1.1 200 OK\nContent-Type: text/plain; version=0.0.4\n\n")
+        self.wfile.write(metrics.render())
         
 class Player(threading.Thread):
     def __init__(self, options, server):
         self.options = options
         self.server = server
+        self.registry = NodeRegistry(options.max_nodes, options.node_ttl)
+        self.window = None
+        if options.window:
+            self.window = SlidingWindow(options.window, self.registry)
+        self.stats = None
+        if options.stats:
+            self.stats = GraphStats(reverse=True)
+        self.last_publish = time.time()
         threading.Thread.__init__(self)
         
+    def dispatch(self, batch):
+        '''
+        Registers the users of a batch of statuses in the node registry and
+        the retweets in the sliding window, and dispatches the batch together
+        with the resulting evictions and expiries.
+        Both are based on the time of the statuses, not the replay time.
+        The graph statistics, if enabled, are sent at most every
+        stats seconds of replay time.
+        '''
+        registry = self.registry
+        window = self.window
+        stats = self.stats
+        events = []
+        for status in batch:
+            now = calendar.timegm(status.date.utctimetuple())
+            if window is not None:
+                expiry = window.expire(now)
+                if expiry is not None:
+                    if stats is not None:
+                        remove_stats(stats, expiry.edges, expiry.nodes)
+                    events.append(expiry)
+            status.source_index = registry.intern(status.source, now)
+            status.target_index = registry.intern(status.target, now)
+            evicted = registry.expire(now)
+            if evicted:
+                if stats is not None:
+                    remove_stats(stats, (), evicted)
+                events.append(NodeEviction(evicted))
+            if window is not None:
+                window.add_edge(status.status_id, status.source, status.target, now)
+            if stats is not None:
+                stats.add_edge(status.source, status.target)
+            events.append(status)
+        if stats is not None and time.time() - self.last_publish >= self.options.stats:
+            self.last_publish = time.time()
+            update = stats_update(stats, registry)
+            if update.nodes:
+                events.append(update)
+        dispatch_batch(events)
+        
     def run(self):
         print "Waiting %s seconds before start streaming" % self.options.delay
         time.sleep(self.options.delay)
         
         print "Streaming retweets for file '%s'"%self.options.log
-        listener = StreamingListener(self.options.timewarp)
+        scheduler = TimewarpScheduler(self.dispatch, self.options.timewarp, self.options.max_eps)
+        verbose = self.options.verbose
         f = open(self.options.log)
         
-        line = f.readline()
-        while line != '':
-            listener.on_data(line)
-            line = f.readline()
+        for line in f:
+            retweet = extract_retweet(line)
+            if retweet is None:
+                continue
+            if verbose:
+                print retweet[3]
+            scheduler.push(retweet[4], Status(*retweet))
+        scheduler.finish()
             
         print "Stream finished"
-        dispatch_event((None, None, None, None, None))
+        dispatch_event(None)
         self.server.shutdown()
         
 class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
     """Handle requests in a separate thread."""
     
+    windowed = False
+    max_latency = None
+    
     def start(self):
         self.serve_forever()
         
@@ -200,19 +530,33 @@ class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
 def parseOptions():
     parser = optparse.OptionParser()
     parser.add_option("-l", "--log", type="string", dest="log", help="Log file of collected streaming data", default='undefined')
-    parser.add_option("-t", "--timewarp", type="float", dest="timewarp", help="Time warping factor, used to accelerate or slow down the replay", default='1.0')
+    parser.add_option("-t", "--timewarp", type="float", dest="timewarp", help="Time warping factor, used to accelerate or slow down the replay (0 replays as fast as possible)", default='1.0')
+    parser.add_option("-m", "--max_eps", type="float", dest="max_eps", help="Maximum number of events per second", default=None)
     parser.add_option("-d", "--delay", type="int", dest="delay", help="Starting delay in seconds", default='0')
+    parser.add_option("--max_latency", type="float", dest="max_latency", help="Maximum seconds events are held to be written together to a client (0 writes each event at once)", default=0.1)
     parser.add_option("-s", "--serverport", type="int", dest="serverport", help="HTTP server port", default=8181)
+    parser.add_option("--max_nodes", type="int", dest="max_nodes", help="Maximum number of users kept, the least recently seen are deleted", default=None)
+    parser.add_option("--node_ttl", type="float", dest="node_ttl", help="Delete users not seen for this many seconds of stream time", default=None)
+    parser.add_option("--window", type="float", dest="window", help="Delete retweets older than this many seconds of stream time, and users left without retweets", default=None)
+    parser.add_option("--stats", type="float", dest="stats", help="Send degrees, PageRank and component of users every this many seconds", default=None)
+    parser.add_option("-v", "--verbose", action="store_true", dest="verbose", help="Print the text of replayed retweets", default=False)
+    parser.add_option("--metrics", action="store_true", dest="metrics", help="Serve queue depths, lag, throughput and drop counters at /metrics", default=False)
     (options, _) = parser.parse_args()
     if options.log == 'undefined':
         parser.error("Log file is mandatory")
     return options
         
 def main():
+    global metrics
     options = parseOptions()
+    if options.metrics:
+        metrics = Metrics()
+        metrics.gauge('pygephi_subscribers', 'Connected clients', function=lambda: len(active_queues))
 
     try:
         server = ThreadedHTTPServer(('', options.serverport), RequestHandler)
+        server.windowed = bool(options.window)
+        server.max_latency = options.max_latency
         
         player = Player(options, server)
         player.setDaemon(True)
@@ -223,7 +567,7 @@ def main():
     except KeyboardInterrupt:
         print 'Stopping server...'
         server.stop()
-        dispatch_event((None, None, None, None, None))
+        dispatch_event(None)
         sys.exit(0)
 
 if __name__ == '__main__':
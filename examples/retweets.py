@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Lightweight extraction of retweets from raw Twitter Streaming API data.
+
+Building full tweepy Status and User objects for every line is the
+bottleneck when replaying large archives, so lines that cannot be retweets
+are discarded before any JSON decoding, and only the id, creation date,
+user screen name and text of the remaining statuses are used.
+'''
+
+try:
+    import json
+except ImportError:
+    try:
+        import simplejson as json
+    except:
+        raise "Requires either simplejson or Python 2.6!"
+
+from datetime import datetime
+import re
+
+RETWEET_MARKER = 'RT @'
+retweet_re = re.compile('(?<=RT\s@)\w+')
+
+_last_date = (None, None)
+
+def parse_date(created_at):
+    '''
+    Parses the Twitter created_at format, e.g. 'Wed Aug 27 13:08:45 +0000 2008'.
+    Consecutive statuses often share the same second, so the last
+    result is cached.
+    '''
+    global _last_date
+    last = _last_date
+    if last[0] == created_at:
+        return last[1]
+    date = datetime.strptime(created_at, '%a %b %d %H:%M:%S +0000 %Y')
+    _last_date = (created_at, date)
+    return date
+
+def extract_retweet(line):
+    '''
+    Returns a tuple (id, source, target, text, date) if the line holds a retweet,
+    where source is the retweeted user and target the user that retweeted,
+    or None otherwise.
+    '''
+    if RETWEET_MARKER not in line:
+        return None
+    try:
+        data = json.loads(line)
+        text = data['text']
+        m = retweet_re.search(text)
+        if not m:
+            return None
+        return (data['id'], m.group(0).lower(), data['user']['screen_name'],
+                text, parse_date(data['created_at']))
+    except (ValueError, KeyError, TypeError):
+        return None
@@ -33,6 +33,18 @@ the Graph Streaming plugin.
 The nodes and edges start to appear in the graph visualization. You can run
 the Force Atlas layout in order to get a better layout.
 
+The following parameters can be added to the Source URL:
+  aggregate=1           Send one edge per pair of users, weighted by the number of retweets
+  ce_interval=SECONDS   Minimum interval between weight updates of an aggregated edge
+                        (default 1.0)
+  max_eps=N             Maximum number of events per second sent to the client. Pending
+                        weight changes are coalesced and new retweets dropped when over it
+  min_degree=N          Only send users with at least N retweets, and the retweets
+                        between them, as soon as they reach it
+
+When started with --metrics, the server also answers http://localhost:8181/metrics
+in the Prometheus text format.
+
 Usage: server.py [options]
 
 Options:
@@ -43,6 +55,26 @@ Options:
   -q QUERY, --query=QUERY
                         Comma-separated list of keywords
   -l LOG, --log=LOG     Output log of streaming data
+  --log_buffer=BYTES    Bytes of streaming data buffered before writing to the log
+  --log_flush_interval=SECONDS
+                        Maximum seconds between log writes
+  --log_compress        Compress the log with gzip
+  --log_rotate_size=BYTES
+                        Rotate the log after this many bytes on disk (compressed
+                        bytes with --log_compress)
+  --log_rotate_interval=SECONDS
+                        Rotate the log after this many seconds
+  --log_fsync=POLICY    When to fsync the log: never, flush or rotate
+  -w N, --workers=N     Number of parse workers
+  --queue_size=N        Maximum number of messages waiting between pipeline stages
+  --window=SECONDS      Delete retweets older than this many seconds, and users left without retweets
+  --stats=SECONDS       Send degrees, PageRank and component of users every this many seconds
+  --max_latency=SECONDS Maximum seconds events are held to be written together to a client
+                        (default 0.1, 0 writes each event at once)
+  -v, --verbose         Print the text of received retweets
+  --max_nodes=N         Maximum number of users kept, the least recently seen are deleted
+  --node_ttl=SECONDS    Delete users not seen for this many seconds
+  --metrics             Serve queue depths, lag, throughput and drop counters at /metrics
 
 
 Created on Nov 10, 2010
@@ -54,16 +86,23 @@ from SocketServer import ThreadingMixIn
 import urlparse
 import tweepy
 import re
-from pygephi import GephiFileHandler
+from pygephi import GephiFileHandler, NodeRegistry, NodeEviction, KnownNodes
+from pygephi import SlidingWindow, Expiry, EdgeAggregator, RateLimiter
+from pygephi import DegreeFilter, GraphStats, StatsUpdate, Metrics
 import threading
 import Queue
 import socket
 import optparse
 import sys
 import time
+import math
+import os
+import gzip
+from retweets import extract_retweet
 
 api = tweepy.API()
 active_queues = []
+metrics = None
 
 class Status(object):
     
@@ -73,41 +112,260 @@ class Status(object):
         self.target = target
         self.text = text
         self.date = date
+        self.source_index = None
+        self.target_index = None
 
 class StreamingListener(tweepy.StreamListener):
+    '''
+    Only hands the raw data over to the parse workers, so that the Twitter
+    connection is never held up by processing. If the workers fall behind,
+    data is dropped and counted instead of blocking.
+    '''
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, raw_queue, *args, **kwargs):
         tweepy.StreamListener.__init__(self, *args, **kwargs)
-        self.known_users = {}
+        self.raw_queue = raw_queue
         self.stream_log = None
+        self.dropped = 0
     
     def on_data(self, data):
         self.stream_log.write(data)
-        self.stream_log.flush()
-        super(StreamingListener, self).on_data(data)
+        try:
+            self.raw_queue.put_nowait(data)
+        except Queue.Full:
+            self.dropped += 1
+            
+class ParseWorker(threading.Thread):
+    '''
+    Extracts retweets from raw stream data and queues them for dispatch.
+    '''
+    
+    def __init__(self, raw_queue, status_queue, verbose=False):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.raw_queue = raw_queue
+        self.status_queue = status_queue
+        self.verbose = verbose
+        
+    def run(self):
+        while True:
+            retweet = extract_retweet(self.raw_queue.get())
+            if retweet is None:
+                continue
+            if self.verbose:
+                print retweet[3]
+            self.status_queue.put(Status(*retweet))
+            
+class Dispatcher(threading.Thread):
+    '''
+    Fans out parsed statuses to the queues of all connected clients.
+    Users are registered in the shared node registry and retweets in the
+    sliding window here, so that evictions and expiries reach the clients
+    in order with the statuses. The graph statistics, if enabled, are also
+    kept here and sent every stats_interval seconds.
+    '''
+    
+    def __init__(self, status_queue, registry, window=None, stats=None, stats_interval=1.0):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.status_queue = status_queue
+        self.registry = registry
+        self.window = window
+        self.stats = stats
+        self.stats_interval = stats_interval
+        
+    def run(self):
+        registry = self.registry
+        window = self.window
+        stats = self.stats
+        timeout = None
+        if window is not None or stats is not None:
+            # wake up regularly to expire and publish also when idle
+            timeout = 1.0
+        last_publish = time.time()
+        while True:
+            try:
+                status = self.status_queue.get(True, timeout)
+            except Queue.Empty:
+                status = None
+            now = time.time()
+            if window is not None:
+                expiry = window.expire(now)
+                if expiry is not None:
+                    if stats is not None:
+                        remove_stats(stats, expiry.edges, expiry.nodes)
+                    dispatch_event(expiry)
+            if status is not None:
+                status.source_index = registry.intern(status.source)
+                status.target_index = registry.intern(status.target)
+                evicted = registry.expire()
+                if evicted:
+                    if stats is not None:
+                        remove_stats(stats, (), evicted)
+                    dispatch_event(NodeEviction(evicted))
+                if window is not None:
+                    window.add_edge(status.status_id, status.source, status.target, now)
+                if stats is not None:
+                    stats.add_edge(status.source, status.target)
+                dispatch_event(status)
+            if stats is not None and now - last_publish >= self.stats_interval:
+                last_publish = now
+                update = stats_update(stats, registry)
+                if update.nodes:
+                    dispatch_event(update)
+            
+class StreamLogWriter(threading.Thread):
+    '''
+    Writes the raw stream data to a log file in a separate thread, so that
+    the ingest thread never waits on disk.
+    Data is buffered and written out when buffer_size bytes are pending or
+    every flush_interval seconds, which also bounds what is lost on a crash.
+    The file can be gzip compressed and rotated by size or age; the size
+    is the size of the file on disk, so compressed bytes when compressing.
+    The fsync policy is one of 'never', 'flush' or 'rotate'.
+    '''
     
-    def on_status(self, status):
-        print status.text
-        
-        m = re.search('(?<=RT\s@)\w+', status.text)
-        if m:
-            source_user = m.group(0).lower()
-            target_user = status.user.screen_name
-            status_id = status.id
-            date = status.created_at
-            text = status.text
+    def __init__(self, path, buffer_size=64*1024, flush_interval=1.0, compress=False,
+                 rotate_size=None, rotate_interval=None, fsync='never', max_pending=100000):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        if compress and not path.endswith('.gz'):
+            path += '.gz'
+        self.path = path
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.rotate_size = rotate_size
+        self.rotate_interval = rotate_interval
+        self.fsync = fsync
+        self.queue = Queue.Queue(max_pending)
+        self.dropped = 0
+        self.out = None
+        
+    def write(self, data):
+        try:
+            self.queue.put_nowait(data)
+        except Queue.Full:
+            self.dropped += 1
             
-            dispatch_event(Status(status_id, source_user, target_user, text, date))
+    def close(self):
+        if self.is_alive():
+            self.queue.put(None)
+            self.join()
+        
+    def run(self):
+        self._open()
+        pending = []
+        size = 0
+        last_flush = time.time()
+        while True:
+            timeout = max(0, last_flush + self.flush_interval - time.time())
+            try:
+                data = self.queue.get(True, timeout)
+            except Queue.Empty:
+                data = ''
+            if data is None:
+                break
+            if data:
+                if isinstance(data, unicode):
+                    data = data.encode('utf-8')
+                pending.append(data)
+                size += len(data)
+            if size >= self.buffer_size or time.time() - last_flush >= self.flush_interval:
+                self._flush(pending)
+                pending = []
+                size = 0
+                last_flush = time.time()
+        self._flush(pending)
+        self._close()
+        
+    def _open(self):
+        if self.compress:
+            self.out = gzip.open(self.path, 'ab')
+        else:
+            self.out = open(self.path, 'ab')
+        self.opened = time.time()
+        self.size = os.path.getsize(self.path)
+        
+    def _disk_size(self):
+        return os.fstat(self.out.fileno()).st_size
+        
+    def _close(self):
+        self.out.flush()
+        if self.fsync != 'never':
+            os.fsync(self.out.fileno())
+        self.out.close()
+        
+    def _flush(self, pending):
+        if pending:
+            self.out.write(''.join(pending))
+        self.out.flush()
+        self.size = self._disk_size()
+        if self.fsync == 'flush':
+            os.fsync(self.out.fileno())
+        if ((self.rotate_size and self.size >= self.rotate_size) or
+            (self.rotate_interval and time.time() - self.opened >= self.rotate_interval)):
+            self._rotate()
             
+    def _rotate(self):
+        self._close()
+        base = self.path[:-3] if self.compress else self.path
+        ext = '.gz' if self.compress else ''
+        suffix = time.strftime('%Y%m%d-%H%M%S')
+        rotated = '%s.%s%s' % (base, suffix, ext)
+        n = 1
+        while os.path.exists(rotated):
+            rotated = '%s.%s-%d%s' % (base, suffix, n, ext)
+            n += 1
+        os.rename(self.path, rotated)
+        self._open()
+        
 def dispatch_event(e):
+    now = time.time()
     for q in active_queues:
-        q.put(e)
+        q.put((now, e))
+        
+def remove_stats(stats, edges, nodes):
+    for _, source, target in edges:
+        stats.remove_edge(source, target)
+    for node_id, _ in nodes:
+        stats.remove_node(node_id)
+        
+def stats_update(stats, registry):
+    '''
+    Collects the changed graph statistics, sizing users by their PageRank.
+    '''
+    nodes = []
+    for node_id, attributes in stats.changes().iteritems():
+        index = registry.index(node_id)
+        if index is not None:
+            attributes['size'] = 5.0*math.sqrt(max(1.0, attributes['pagerank']))
+            nodes.append((node_id, index, attributes))
+    return StatsUpdate(nodes)
         
 class RequestProcessor():
     
-    def __init__(self, parameters, out):
+    def __init__(self, parameters, out, windowed=False, metrics=None, metrics_labels=None,
+                 max_latency=None):
         
-        self.known_users = {}
+        self.known_users = KnownNodes()
+        self.sent_edges = set() if windowed else None
+        
+        self.aggregator = None
+        self.timeout = None
+        if "aggregate" in parameters:
+            self.timeout = float(parameters.get("ce_interval", ["1.0"])[0])
+            self.aggregator = EdgeAggregator(self.timeout)
+            self.last_flush = time.time()
+            
+        self.limiter = None
+        self.dropped = 0
+        if "max_eps" in parameters:
+            self.limiter = RateLimiter(float(parameters["max_eps"][0]))
+            
+        self.degree_filter = None
+        if "min_degree" in parameters:
+            self.degree_filter = DegreeFilter(int(parameters["min_degree"][0]))
         
         if "q" in parameters:
             q = parameters["q"][0]
@@ -117,11 +375,22 @@ class RequestProcessor():
             self.terms = None
             print "Request for retweets, no query string"
         
-        self.handler = GephiFileHandler(out)
+        self.handler = GephiFileHandler(out, not max_latency, max_latency,
+                                        metrics=metrics, metrics_labels=metrics_labels)
     
     def process(self, status):
         messages = []
         
+        if isinstance(status, NodeEviction):
+            self.delete_nodes(status.nodes)
+            return messages
+        if isinstance(status, Expiry):
+            self.expire(status)
+            return messages
+        if isinstance(status, StatsUpdate):
+            self.update_stats(status)
+            return messages
+        
         found = False
         if (self.terms):
             for term in self.terms:
@@ -131,22 +400,137 @@ class RequestProcessor():
             if not found:
                 return messages
             
-        default_node_attr = {'size':5, 'r':84./255., 'g':148./255., 'b':183./255.}
+        if self.degree_filter is None:
+            self.send_retweet(status)
+            return messages
+        
+        passed, released = self.degree_filter.add_edge(status.status_id, status.source,
+                                                       status.target, status)
+        for node_id in passed:
+            index = status.source_index if node_id == status.source else status.target_index
+            if self.send_node(node_id, index) and self.limiter is not None:
+                self.limiter.consume()
+        for retweet in released:
+            self.send_retweet(retweet)
+        return messages
+            
+    def send_node(self, node_id, index):
+        if not self.known_users.add(index):
+            return False
+        attributes = {'size':5, 'r':84./255., 'g':148./255., 'b':183./255., 'label':node_id}
+        self.handler.add_node(node_id, **attributes)
+        return True
+        
+    def send_retweet(self, status):
+        if self.limiter is not None and not self.admit(status):
+            self.dropped += 1
+            return
+        
+        self.send_node(status.source, status.source_index)
+        self.send_node(status.target, status.target_index)
+        
+        if self.sent_edges is not None:
+            self.sent_edges.add(status.status_id)
+        if self.aggregator is None:
+            attributes = {'directed':True, 'weight':2.0, 'date':str(status.date)}
+            self.handler.add_edge(status.status_id, status.source, status.target, **attributes)
+        else:
+            self.aggregate(self.aggregator.add(status.source, status.target, time.time()),
+                           status.source, status.target)
+            
+    def admit(self, status):
+        '''
+        Takes a new retweet and the users it adds from the event budget.
+        Retweets of aggregated edges are always admitted, since their weight
+        changes are kept pending while over budget.
+        '''
+        if self.aggregator is not None and (status.source, status.target) in self.aggregator:
+            return True
+        cost = 1
+        if status.source_index not in self.known_users:
+            cost += 1
+        if status.target_index not in self.known_users:
+            cost += 1
+        return self.limiter.allow(cost)
             
-        if status.source not in self.known_users:
-            self.known_users[status.source] = status.source
-            attributes = default_node_attr.copy()
-            attributes['label'] = status.source
-            self.handler.add_node(status.source, **attributes)
+    def aggregate(self, change, source, target):
+        operation, edge_id, weight = change
+        if operation == 'ce' and self.limiter is not None and not self.limiter.allow():
+            self.aggregator.postpone(source, target)
+            return
+        if operation == 'ae':
+            self.handler.add_edge(edge_id, source, target, directed=True, weight=float(weight), count=weight)
+        elif operation == 'ce':
+            self.handler.change_edge(edge_id, weight=float(weight), count=weight)
+        elif operation == 'de':
+            self.handler.delete_edge(edge_id)
+            if self.limiter is not None:
+                self.limiter.consume()
             
-        if status.target not in self.known_users:
-            self.known_users[status.target] = status.target
-            attributes = default_node_attr.copy()
-            attributes['label'] = status.target
-            self.handler.add_node(status.target, **attributes)
-        
-        attributes = {'directed':True, 'weight':2.0, 'date':str(status.date)}
-        self.handler.add_edge(status.status_id, status.source, status.target, **attributes)
+    def flush(self):
+        self.handler.flush()
+        
+    def tick(self):
+        '''
+        Sends the pending weight changes of aggregated edges every ce_interval seconds.
+        '''
+        if self.aggregator is None:
+            return
+        now = time.time()
+        if now - self.last_flush < self.timeout:
+            return
+        if self.limiter is not None and not self.limiter.allow(0):
+            return
+        self.last_flush = now
+        changes = self.aggregator.flush(now)
+        if changes:
+            if self.limiter is not None:
+                self.limiter.consume(len(changes))
+            self.handler.change_edges(dict((edge_id, {'weight':float(weight), 'count':weight})
+                                           for edge_id, weight in changes))
+            
+    def update_stats(self, update):
+        known_users = self.known_users
+        nodes = dict((node_id, attributes) for node_id, index, attributes in update.nodes
+                     if index in known_users)
+        if nodes:
+            self.handler.change_nodes(nodes)
+            if self.limiter is not None:
+                self.limiter.consume(len(nodes))
+            
+    def expire(self, expiry):
+        if self.degree_filter is not None:
+            for edge_id, _, _ in expiry.edges:
+                self.degree_filter.remove_edge(edge_id)
+        sent_edges = self.sent_edges
+        edges = [edge for edge in expiry.edges if edge[0] in sent_edges]
+        if self.aggregator is None:
+            edge_ids = [edge[0] for edge in edges]
+            if edge_ids:
+                sent_edges.difference_update(edge_ids)
+                self.handler.delete_edges(edge_ids)
+                if self.limiter is not None:
+                    self.limiter.consume(len(edge_ids))
+        else:
+            now = time.time()
+            for edge_id, source, target in edges:
+                sent_edges.discard(edge_id)
+                self.aggregate(self.aggregator.remove(source, target, now), source, target)
+        self.delete_nodes(expiry.nodes)
+        
+    def delete_nodes(self, nodes):
+        if self.degree_filter is not None:
+            for node_id, _ in nodes:
+                self.degree_filter.discard_node(node_id)
+        known_users = self.known_users
+        deleted = [node_id for node_id, index in nodes if known_users.discard(index)]
+        if deleted:
+            self.handler.delete_nodes(deleted)
+            if self.limiter is not None:
+                self.limiter.consume(len(deleted))
+            if self.aggregator is not None:
+                for node_id in deleted:
+                    self.aggregator.discard_node(node_id)
 
 class RequestHandler(BaseHTTPRequestHandler):
 
@@ -158,48 +542,107 @@ class RequestHandler(BaseHTTPRequestHandler):
 
     def do_GET(self):
         
-        param_str = urlparse.urlparse(self.path).query
-        parameters = urlparse.parse_qs(param_str, keep_blank_values=False)
+        url = urlparse.urlparse(self.path)
+        if url.path == '/metrics':
+            self.send_metrics()
+            return
+        parameters = urlparse.parse_qs(url.query, keep_blank_values=False)
         
         self.queue = Queue.Queue()
-        active_queues.append(self.queue)
         
         self.wfile.write("HTTP/1.1 200 OK\nContent-Type: application/json\n\n")
         
-        request_processor = RequestProcessor(parameters, self.wfile)
+        labels = {'client': '%s:%s' % self.client_address}
+        request_processor = RequestProcessor(parameters, self.wfile, self.server.windowed,
+                                             metrics, labels, self.server.max_latency)
+        lag = None
+        if metrics is not None:
+            metrics.gauge('pygephi_client_queue_depth', 'Events waiting to be sent to the client',
+                          function=self.queue.qsize, **labels)
+            metrics.gauge('pygephi_client_dropped', 'Retweets dropped by the rate limit',
+                          function=lambda: request_processor.dropped, **labels)
+            lag = metrics.histogram('pygephi_client_lag_seconds',
+                                    'Time between dispatching an event and processing it', **labels)
+        active_queues.append(self.queue)
         
-        while True:
-                        
-            status = self.queue.get()
-            if status is None: break
-            
-            try:
+        try:
+            while True:
                 
-                request_processor.process(status)
+                try:
+                    dispatched, status = self.queue.get(True, request_processor.timeout)
+                    if status is None: break
+                    if lag is not None:
+                        lag.observe(time.time() - dispatched)
+                except Queue.Empty:
+                    status = None
                 
-            except socket.error:
-                print "Connection closed"
-                active_queues.remove(self.queue)
-                return
+                if status is not None:
+                    request_processor.process(status)
+                request_processor.tick()
+                if self.queue.empty():
+                    request_processor.flush()
+            
+            request_processor.flush()
+                
+        except socket.error:
+            print "Connection closed"
+        finally:
+            active_queues.remove(self.queue)
+            if metrics is not None:
+                metrics.remove(**labels)
+    
+    def send_metrics(self):
+        if metrics is None:
+            self.send_error(404, "Metrics are not enabled")
+            return
+        self.wfile.write("HTTP/1.1 200 OK\nContent-Type: text/plain; version=0.0.4\n\n")
+        self.wfile.write(metrics.render())
         
 class Collector(threading.Thread):
     def __init__(self, options):
         self.options = options
         threading.Thread.__init__(self)
+        self.stream_log = StreamLogWriter(options.log, options.log_buffer, options.log_flush_interval,
+                                          options.log_compress, options.log_rotate_size,
+                                          options.log_rotate_interval, options.log_fsync)
         
     def run(self):
         q = self.options.query.split(",")
 #        q = [e+ ' rt' for e in q]
         
         print "Streaming retweets for query '%s'"%q
-        listener = StreamingListener()
+        options = self.options
+        raw_queue = Queue.Queue(options.queue_size)
+        status_queue = Queue.Queue(options.queue_size)
+        for _ in range(options.workers):
+            ParseWorker(raw_queue, status_queue, options.verbose).start()
+        registry = NodeRegistry(options.max_nodes, options.node_ttl)
+        window = None
+        if options.window:
+            window = SlidingWindow(options.window, registry)
+        stats = None
+        if options.stats:
+            stats = GraphStats(reverse=True)
+        Dispatcher(status_queue, registry, window, stats, options.stats).start()
+        listener = StreamingListener(raw_queue)
         
         def on_error(status_code):
             if status_code == 401:
                 raise Exception("Authentication error")
         listener.on_error = on_error
         
-        listener.stream_log = file(self.options.log, 'a')
+        stream_log = self.stream_log
+        stream_log.start()
+        listener.stream_log = stream_log
+        if metrics is not None:
+            metrics.gauge('pygephi_raw_queue_depth', 'Raw messages waiting to be parsed',
+                          function=raw_queue.qsize)
+            metrics.gauge('pygephi_status_queue_depth', 'Parsed retweets waiting to be dispatched',
+                          function=status_queue.qsize)
+            metrics.gauge('pygephi_stream_dropped', 'Raw messages dropped by the listener',
+                          function=lambda: listener.dropped)
+            metrics.gauge('pygephi_log_dropped', 'Raw messages dropped by the log writer',
+                          function=lambda: stream_log.dropped)
         auth = tweepy.OAuthHandler(self.options.consumer_key, self.options.consumer_secret)
         auth.set_access_token(self.options.access_token, self.options.access_token_secret)
         stream = tweepy.streaming.Stream(auth, listener, timeout=60.0)
@@ -216,6 +659,9 @@ class Collector(threading.Thread):
 class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
     """Handle requests in a separate thread."""
     
+    windowed = False
+    max_latency = None
+    
     def start(self):
         self.serve_forever()
         
@@ -230,7 +676,22 @@ def parseOptions():
     parser.add_option("-T", "--access_token_secret", type="string", dest="access_token_secret", help="Twitter access token secret", default='undefined')
     parser.add_option("-q", "--query", type="string", dest="query", help="Comma-separated list of keywords", default="twitter")
     parser.add_option("-l", "--log", type="string", dest="log", help="Output log of streaming data", default="/tmp/stream.log")
+    parser.add_option("--log_buffer", type="int", dest="log_buffer", help="Bytes of streaming data buffered before writing to the log", default=64*1024)
+    parser.add_option("--log_flush_interval", type="float", dest="log_flush_interval", help="Maximum seconds between log writes", default=1.0)
+    parser.add_option("--log_compress", action="store_true", dest="log_compress", help="Compress the log with gzip", default=False)
+    parser.add_option("--log_rotate_size", type="int", dest="log_rotate_size", help="Rotate the log after this many bytes on disk (compressed bytes with --log_compress)", default=None)
+    parser.add_option("--log_rotate_interval", type="float", dest="log_rotate_interval", help="Rotate the log after this many seconds", default=None)
+    parser.add_option("--log_fsync", type="choice", choices=["never", "flush", "rotate"], dest="log_fsync", help="When to fsync the log: never, flush or rotate", default="never")
+    parser.add_option("-w", "--workers", type="int", dest="workers", help="Number of parse workers", default=2)
+    parser.add_option("--queue_size", type="int", dest="queue_size", help="Maximum number of messages waiting between pipeline stages", default=10000)
+    parser.add_option("--window", type="float", dest="window", help="Delete retweets older than this many seconds, and users left without retweets", default=None)
+    parser.add_option("--stats", type="float", dest="stats", help="Send degrees, PageRank and component of users every this many seconds", default=None)
+    parser.add_option("-v", "--verbose", action="store_true", dest="verbose", help="Print the text of received retweets", default=False)
+    parser.add_option("--max_nodes", type="int", dest="max_nodes", help="Maximum number of users kept, the least recently seen are deleted", default=None)
+    parser.add_option("--node_ttl", type="float", dest="node_ttl", help="Delete users not seen for this many seconds", default=None)
+    parser.add_option("--max_latency", type="float", dest="max_latency", help="Maximum seconds events are held to be written together to a client (0 writes each event at once)", default=0.1)
     parser.add_option("-s", "--serverport", type="int", dest="serverport", help="HTTP server port", default=8181)
+    parser.add_option("--metrics", action="store_true", dest="metrics", help="Serve queue depths, lag, throughput and drop counters at /metrics", default=False)
     (options, _) = parser.parse_args()
     if options.consumer_key == 'undefined' or options.consumer_secret == 'undefined':
         parser.error("Twitter consumer key and consumer secret are mandatory")
@@ -239,18 +700,25 @@ def parseOptions():
     return options
         
 def main():
+    global metrics
     options = parseOptions()
+    if options.metrics:
+        metrics = Metrics()
+        metrics.gauge('pygephi_subscribers', 'Connected clients', function=lambda: len(active_queues))
     collector = Collector(options)
     collector.setDaemon(True)
     collector.start()
     try:
         server = ThreadedHTTPServer(('', options.serverport), RequestHandler)
+        server.windowed = bool(options.window)
+        server.max_latency = options.max_latency
         print 'Test server running...'
         server.start()
     except KeyboardInterrupt:
         print 'Stopping server...'
         server.stop()
         dispatch_event(None)
+        collector.stream_log.close()
         sys.exit(0)
 
 if __name__ == '__main__':
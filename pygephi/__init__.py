@@ -16,4 +16,16 @@
 # limitations under the License.
 
 from client import GephiClient, GephiFileHandler
+from registry import NodeRegistry, NodeEviction, KnownNodes
+from window import SlidingWindow, Expiry
+from aggregation import EdgeAggregator
+from throttle import RateLimiter
+from filters import DegreeFilter
+from graphstats import GraphStats, GraphStatsClient, StatsUpdate
+from instrumentation import Metrics
+from clock import Clock, CoarseClock
+from delivery import CircuitBreaker, CircuitOpenError, Spool
+from sharding import ShardedGephiClient, ShardError
+from reader import GraphStreamReader, GraphEvent, StreamGraph
+from loader import BulkLoader
 
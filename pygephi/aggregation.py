@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Aggregation of repeated edges into weighted edges.
+"""
+
+class EdgeAggregator(object):
+    """
+    Collapses the edges between the same source and target into one edge
+    whose weight is the number of edges collapsed.
+    A weight change is sent right away only if the edge was not updated in
+    the last min_interval seconds; otherwise it is kept pending until the
+    next update or flush().
+    
+    add() and remove() return a tuple (operation, edge id, weight), where
+    operation is 'ae', 'ce', 'de' or None if nothing has to be sent.
+    """
+    
+    def __init__(self, min_interval=1.0):
+        self.min_interval = min_interval
+        self.edges = {}
+        self.node_edges = {}
+        self.dirty = set()
+        
+    def __len__(self):
+        return len(self.edges)
+        
+    def __contains__(self, key):
+        return key in self.edges
+        
+    def add(self, source, target, now):
+        key = (source, target)
+        edge = self.edges.get(key)
+        if edge is None:
+            edge_id = '%s->%s' % key
+            self.edges[key] = [edge_id, 1, now]
+            self.node_edges.setdefault(source, set()).add(key)
+            self.node_edges.setdefault(target, set()).add(key)
+            return ('ae', edge_id, 1)
+        edge[1] += 1
+        return self._changed(key, edge, now)
+    
+    def remove(self, source, target, now):
+        key = (source, target)
+        edge = self.edges.get(key)
+        if edge is None:
+            return (None, None, 0)
+        edge[1] -= 1
+        if edge[1] <= 0:
+            self._delete(key)
+            return ('de', edge[0], 0)
+        return self._changed(key, edge, now)
+    
+    def postpone(self, source, target):
+        """
+        Keeps the weight change of an edge pending until the next flush(),
+        for when it could not be sent.
+        """
+        key = (source, target)
+        if key in self.edges:
+            self.dirty.add(key)
+            
+    def discard_node(self, node_id):
+        """
+        Forgets the edges of a node that was deleted, without returning
+        any operation since deleting the node also deletes its edges.
+        """
+        for key in list(self.node_edges.get(node_id, ())):
+            self._delete(key)
+            
+    def _delete(self, key):
+        del self.edges[key]
+        self.dirty.discard(key)
+        for node_id in key:
+            keys = self.node_edges.get(node_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.node_edges[node_id]
+    
+    def _changed(self, key, edge, now):
+        if now - edge[2] >= self.min_interval:
+            edge[2] = now
+            self.dirty.discard(key)
+            return ('ce', edge[0], edge[1])
+        self.dirty.add(key)
+        return (None, edge[0], edge[1])
+    
+    def flush(self, now):
+        """
+        Returns the pending weight changes as a list of (edge id, weight) pairs.
+        """
+        changes = []
+        edges = self.edges
+        for key in self.dirty:
+            edge = edges[key]
+            edge[2] = now
+            changes.append((edge[0], edge[1]))
+        self.dirty.clear()
+        return changes
@@ -22,6 +22,7 @@ Allow a Python script to communicate with Gephi using the Gephi Graph Streaming
 __author__ = 'panisson@gmail.com'
 
 import urllib2
+import httplib
 try:
     import json
 except ImportError:
@@ -31,74 +32,428 @@ except ImportError:
         raise "Requires either simplejson or Python 2.6!"
 
 import time
+from clock import Clock, coarse_clock
+from delivery import CircuitBreaker, CircuitOpenError, Spool
+
+STAGES = ('hooks', 'batch_hooks', 'encode', 'send')
+
+# returned by _send when the data was kept to be sent later
+SPOOLED = object()
 
 class JSONClient(object):
+    """
+    Encodes events in the Graph Streaming format and buffers them until flush().
+    Deletes are buffered like the other events, so that they are sent in
+    order with them: with autoflush=False, call flush() to send them.
+    
+    process_event_hook is a callable, or a list of callables applied in order,
+    that receives each event and returns the event to send. Each of
+    batch_hooks receives the list of events of a flush and returns the list
+    to send. With trace_every=N, one in every N events and flushes is timed,
+    and the seconds spent in each stage ('hooks', 'batch_hooks', 'encode',
+    'send') are passed to trace_hook(stage, seconds) and, if metrics are
+    given, observed in pygephi_stage_seconds.
     
-    def __init__(self, autoflush=False, enable_timestamps=False, process_event_hook=None):
-        self.data = ""
+    enable_timestamps adds the time 't' to the events that do not carry one
+    already. With True or 'event' the clock is read for every event, with
+    'batch' once for all the events of a flush, and with 'coarse' from a
+    cached clock refreshed every coarse_interval seconds. timestamp_unit is
+    's' or 'ms', and a monotonic clock never goes backwards.
+    """
+    
+    def __init__(self, autoflush=False, enable_timestamps=False, process_event_hook=None,
+                 metrics=None, metrics_labels=None, batch_hooks=None, trace_every=None,
+                 trace_hook=None, timestamp_unit='s', monotonic=False, coarse_interval=0.05):
+        self.data = []
+        self.events = []
         self.autoflush = autoflush
         self.enable_timestamps = enable_timestamps
         
-        if enable_timestamps:
-            def default_peh(event):
-                event['t'] = int(time.time())
-                return event
-        else:
-            default_peh = lambda e: e
-        if process_event_hook is None:
-            self.peh = default_peh
+        self.metrics = metrics
+        self.metrics_labels = metrics_labels or {}
+        self.events_encoded = None
+        self.bytes_sent = None
+        self.flush_seconds = None
+        self.send_errors = None
+        self.stage_seconds = {}
+        if metrics is not None:
+            labels = metrics_labels or {}
+            self.events_encoded = metrics.counter('pygephi_events_encoded_total',
+                                                  'Events encoded by the client', **labels)
+            self.bytes_sent = metrics.counter('pygephi_bytes_sent_total',
+                                              'Bytes sent by the client', **labels)
+            self.flush_seconds = metrics.histogram('pygephi_flush_seconds',
+                                                   'Time taken to send each flush', **labels)
+            self.send_errors = metrics.counter('pygephi_send_errors_total',
+                                               'Errors while sending', **labels)
+            if trace_every:
+                for stage in STAGES:
+                    self.stage_seconds[stage] = metrics.histogram('pygephi_stage_seconds',
+                        'Sampled time spent in each stage of the client', stage=stage, **labels)
+        
+        self.hooks = []
+        if callable(process_event_hook):
+            self.hooks.append(process_event_hook)
+        elif process_event_hook is not None:
+            self.hooks.extend(process_event_hook)
+        self.batch_time = None
+        if enable_timestamps == 'coarse':
+            self.clock = coarse_clock(timestamp_unit, monotonic, coarse_interval)
         else:
-            self.peh = lambda e: default_peh(process_event_hook(e))
+            self.clock = Clock(timestamp_unit, monotonic)
+        if enable_timestamps == 'batch':
+            self.hooks.append(self._stamp_batch)
+        elif enable_timestamps:
+            self.hooks.append(self._stamp)
+        self.batch_hooks = list(batch_hooks or ())
+        
+        self.trace_every = trace_every
+        self.trace_hook = trace_hook
+        self.pushed = 0
+        self.flushes = 0
+        
+    def _stamp(self, event):
+        if 't' not in event:
+            event['t'] = self.clock()
+        return event
+    
+    def _stamp_batch(self, event):
+        if 't' not in event:
+            if self.batch_time is None:
+                self.batch_time = self.clock()
+            event['t'] = self.batch_time
+        return event
+        
+    def peh(self, event):
+        for hook in self.hooks:
+            event = hook(event)
+        return event
         
     def flush(self):
-        if len(self.data) > 0:
-            self._send(self.data)
-            self.data = ""
+        if not self.data and not self.events:
+            return
+        self.batch_time = None
+        self.flushes += 1
+        traced = self.trace_every and self.flushes % self.trace_every == 0
+        if self.events:
+            events, self.events = self.events, []
+            start = time.time()
+            for hook in self.batch_hooks:
+                events = hook(events)
+            encoding = time.time()
+            for event in events:
+                self._buffer(event)
+            if traced:
+                self._trace('batch_hooks', encoding - start)
+                self._trace('encode', time.time() - encoding)
+        self._flush_buffer(traced)
+        
+    def _buffer(self, event):
+        self.data.append(json.dumps(event) + '\r\n')
+        
+    def _flush_buffer(self, traced):
+        data = ''.join(self.data)
+        if self.flush_seconds is None and not traced:
+            self._send(data)
+        else:
+            self._timed_send(data, traced)
+        self.data = []
+            
+    def _timed_send(self, data, traced=False):
+        start = time.time()
+        try:
+            result = self._send(data)
+        except Exception:
+            if self.send_errors is not None:
+                self.send_errors.inc()
+            raise
+        seconds = time.time() - start
+        if self.flush_seconds is not None:
+            self.flush_seconds.observe(seconds)
+            if result is not SPOOLED:
+                self.bytes_sent.inc(len(data))
+        if traced:
+            self._trace('send', seconds)
+            
+    def _trace(self, stage, seconds):
+        if self.trace_hook is not None:
+            self.trace_hook(stage, seconds)
+        histogram = self.stage_seconds.get(stage)
+        if histogram is not None:
+            histogram.observe(seconds)
+        
+    def _push(self, event):
+        self.pushed += 1
+        if self.trace_every and self.pushed % self.trace_every == 0:
+            self._traced_push(event)
+        else:
+            if self.hooks:
+                event = self.peh(event)
+            if self.batch_hooks:
+                self.events.append(event)
+            else:
+                self._buffer(event)
+        if self.events_encoded is not None:
+            self.events_encoded.inc()
+        if(self.autoflush): self.flush()
+        
+    def _traced_push(self, event):
+        start = time.time()
+        event = self.peh(event)
+        encoding = time.time()
+        self._trace('hooks', encoding - start)
+        if self.batch_hooks:
+            self.events.append(event)
+        else:
+            self._buffer(event)
+            self._trace('encode', time.time() - encoding)
         
     def _send(self, data):
         print 'passing'
         pass
         
+    def _event(self, etype, entities, t):
+        event = {etype:entities}
+        if t is not None:
+            event['t'] = t
+        self._push(event)
+        
     def add_node(self, id, flush=True, **attributes):
-        self.data += json.dumps(self.peh({"an":{id:attributes}})) + '\r\n'
-        if(self.autoflush): self.flush()
+        self._push({"an":{id:attributes}})
+        
+    def add_nodes(self, nodes, t=None):
+        self._event("an", nodes, t)
         
     def change_node(self, id, flush=True, **attributes):
-        self.data += json.dumps(self.peh({"cn":{id:attributes}})) + '\r\n'
-        if(self.autoflush): self.flush()
+        self._push({"cn":{id:attributes}})
+    
+    def change_nodes(self, nodes, t=None):
+        self._event("cn", nodes, t)
     
     def delete_node(self, id):
-        self._send(json.dumps(self.peh({"dn":{id:{}}})) + '\r\n')
+        """
+        Deletes a node and its edges. Like the other events, the delete is
+        only sent on flush() (or at once with autoflush).
+        """
+        self._push({"dn":{id:{}}})
+        
+    def delete_nodes(self, ids, t=None):
+        self._event("dn", dict((id, {}) for id in ids), t)
     
     def add_edge(self, id, source, target, directed=True, **attributes):
         attributes['source'] = source
         attributes['target'] = target
         attributes['directed'] = directed
-        self.data += json.dumps(self.peh({"ae":{id:attributes}})) + '\r\n'
-        if(self.autoflush): self.flush()
+        self._push({"ae":{id:attributes}})
+        
+    def add_edges(self, edges, t=None):
+        """
+        Adds several edges in one event. edges maps each edge id to its
+        attributes, which must include the source and target; 'directed'
+        defaults to True. The given dicts are copied, not modified.
+        """
+        copies = {}
+        for id, attributes in edges.iteritems():
+            if 'source' not in attributes or 'target' not in attributes:
+                raise ValueError("Edge %s has no source or target" % id)
+            attributes = dict(attributes)
+            attributes.setdefault('directed', True)
+            copies[id] = attributes
+        self._event("ae", copies, t)
+    
+    def change_edge(self, id, **attributes):
+        self._push({"ce":{id:attributes}})
+        
+    def change_edges(self, edges, t=None):
+        self._event("ce", edges, t)
     
     def delete_edge(self, id):
-        self._send(json.dumps(self.peh({"de":{id:{}}})) + '\r\n')
+        """
+        Deletes an edge. Like the other events, the delete is only sent on
+        flush() (or at once with autoflush).
+        """
+        self._push({"de":{id:{}}})
+        
+    def delete_edges(self, ids, t=None):
+        self._event("de", dict((id, {}) for id in ids), t)
         
     def clean(self):
-        self._send(json.dumps(self.peh({"dn":{"filter":"ALL"}})) + '\r\n')
+        self._push({"dn":{"filter":"ALL"}})
+        self.flush()
+
+SEND_ERRORS = (IOError, httplib.HTTPException)
+
+def retryable(error):
+    """
+    Whether a send error may go away by itself: connection errors and 5xx
+    responses are, while a 4xx response means the master rejected the data.
+    """
+    return not (isinstance(error, urllib2.HTTPError) and error.code < 500)
+
+SPOOL_TIMEOUT = 10.0
 
 class GephiClient(JSONClient):
+    """
+    Sends the events to a Gephi master.
+    
+    A failed send is retried up to retries times, waiting backoff seconds
+    and then twice as long each time, up to max_backoff. After
+    breaker_threshold consecutive failed flushes, sends fail immediately
+    with CircuitOpenError for breaker_reset seconds. If a spool path is
+    given, data that cannot be sent is appended to it instead of raising,
+    and drained in batches of spool_batch bytes once the master is back.
+    So that a master that is down or stalled does not block the feeder,
+    the spool mode defaults to a timeout of SPOOL_TIMEOUT seconds and to
+    a circuit breaker opening on the first failure.
+    Only connection errors and 5xx responses are retried, count as breaker
+    failures or are spooled: a 4xx response is raised at once.
     
-    def __init__(self, url='http://127.0.0.1:8080/workspace0', autoflush=False):
-        JSONClient.__init__(self, autoflush)
+    With metrics, failed requests (including retried and spooled ones) are
+    counted in pygephi_send_failures_total, retries in
+    pygephi_send_retries_total, and the spooled bytes are exposed in
+    pygephi_spool_pending_bytes. pygephi_send_errors_total only counts the
+    errors raised to the caller, and spooled data is counted in
+    pygephi_bytes_sent_total when it is drained.
+    """
+    
+    def __init__(self, url='http://127.0.0.1:8080/workspace0', autoflush=False, retries=0,
+                 backoff=0.5, max_backoff=30.0, timeout=None, breaker_threshold=None,
+                 breaker_reset=30.0, spool=None, spool_batch=1024*1024, spool_fsync=False,
+                 **params):
+        JSONClient.__init__(self, autoflush, **params)
         self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.spool = None
+        self.spool_batch = spool_batch
+        if spool is not None:
+            self.spool = Spool(spool, spool_fsync)
+            if timeout is None:
+                timeout = SPOOL_TIMEOUT
+            if breaker_threshold is None:
+                breaker_threshold = 1
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
         
-    def _send(self, data):
-        conn = urllib2.urlopen(self.url+ '?operation=updateGraph', data)
+        self.send_failures = None
+        self.send_retries = None
+        if self.metrics is not None:
+            labels = self.metrics_labels
+            self.send_failures = self.metrics.counter('pygephi_send_failures_total',
+                'Failed requests to the Gephi master, including retried and spooled ones', **labels)
+            self.send_retries = self.metrics.counter('pygephi_send_retries_total',
+                                                     'Retried requests to the Gephi master', **labels)
+            if self.spool is not None:
+                self.metrics.gauge('pygephi_spool_pending_bytes', 'Bytes waiting in the spool',
+                                   function=self.spool.pending, **labels)
+        
+    def _post(self, data):
+        url = self.url+ '?operation=updateGraph'
+        if self.timeout is None:
+            conn = urllib2.urlopen(url, data)
+        else:
+            conn = urllib2.urlopen(url, data, self.timeout)
         return conn.read()
+        
+    def _deliver(self, data):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Gephi master at %s is unavailable" % self.url)
+        delay = self.backoff
+        attempt = 0
+        while True:
+            try:
+                result = self._post(data)
+            except SEND_ERRORS, e:
+                if self.send_failures is not None:
+                    self.send_failures.inc()
+                if not retryable(e):
+                    # the master is up, but rejected the data
+                    self.breaker.success()
+                    raise
+                attempt += 1
+                if attempt > self.retries:
+                    self.breaker.failure()
+                    raise
+                if self.send_retries is not None:
+                    self.send_retries.inc()
+                time.sleep(delay)
+                delay = min(delay*2, self.max_backoff)
+            else:
+                self.breaker.success()
+                return result
+        
+    def _send(self, data):
+        if self.spool is None:
+            return self._deliver(data)
+        if not self.spool.pending():
+            try:
+                return self._deliver(data)
+            except SEND_ERRORS, e:
+                if not retryable(e):
+                    raise
+                # the master was just tried, leave the drain to a later send
+                self.spool.append(data)
+                return SPOOLED
+        self.spool.append(data)
+        self.drain()
+        return SPOOLED
+        
+    def drain(self):
+        """
+        Sends the spooled data while the master accepts it. Returns True
+        if the spool is empty, or if there is no spool.
+        A chunk rejected with a 4xx response is dropped from the spool, as
+        it would block the drain forever, and the error is raised.
+        """
+        if self.spool is None:
+            return True
+        while self.spool.pending() and self.breaker.allow():
+            chunk = self.spool.read(self.spool_batch)
+            try:
+                self._post(chunk)
+            except SEND_ERRORS, e:
+                if self.send_failures is not None:
+                    self.send_failures.inc()
+                if not retryable(e):
+                    self.breaker.success()
+                    self.spool.commit(len(chunk))
+                    raise
+                self.breaker.failure()
+                return False
+            self.breaker.success()
+            self.spool.commit(len(chunk))
+            if self.bytes_sent is not None:
+                self.bytes_sent.inc(len(chunk))
+        return not self.spool.pending()
     
 class GephiFileHandler(JSONClient):
+    """
+    Writes the events to a file-like object, such as the connection of a
+    streaming client. By default each event is written as soon as it is
+    added. With autoflush=False, the events are written in a single write
+    when flush() is called, for instance once per dispatch cycle, or as soon
+    as the oldest of them has waited max_delay seconds.
+    """
     
-    def __init__(self, out, **params):
-        params['autoflush'] = True
-        JSONClient.__init__(self, **params)
+    def __init__(self, out, autoflush=True, max_delay=None, **params):
+        JSONClient.__init__(self, autoflush, **params)
         self.out = out
+        self.max_delay = max_delay
+        self.buffered_since = None
+        
+    def _push(self, event):
+        JSONClient._push(self, event)
+        if self.max_delay is not None and (self.data or self.events):
+            now = time.time()
+            if self.buffered_since is None:
+                self.buffered_since = now
+            elif now - self.buffered_since >= self.max_delay:
+                self.flush()
+                
+    def flush(self):
+        self.buffered_since = None
+        JSONClient.flush(self)
         
     def _send(self, data):
         self.out.write(data)
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Clocks used to timestamp the events of the Graph Streaming protocol.
+"""
+
+import time
+import threading
+
+UNITS = {'s': 1, 'ms': 1000}
+
+class Clock(object):
+    """
+    Reads the wall clock as an integer number of seconds or milliseconds.
+    A monotonic clock never goes backwards, even if the system time does.
+    """
+    
+    def __init__(self, unit='s', monotonic=False):
+        self.scale = UNITS[unit]
+        self.monotonic = monotonic
+        self.last = 0
+        self.lock = threading.Lock()
+        
+    def __call__(self):
+        now = int(time.time()*self.scale)
+        if self.monotonic:
+            with self.lock:
+                if now < self.last:
+                    now = self.last
+                self.last = now
+        return now
+    
+class CoarseClock(threading.Thread):
+    """
+    Caches the reading of a clock, refreshed by a daemon thread every
+    interval seconds, so that reading the time costs an attribute lookup.
+    """
+    
+    def __init__(self, clock, interval=0.05):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.clock = clock
+        self.interval = interval
+        self.now = clock()
+        self.stopped = threading.Event()
+        
+    def __call__(self):
+        return self.now
+    
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.now = self.clock()
+            
+    def stop(self):
+        self.stopped.set()
+        
+_coarse_clocks = {}
+_coarse_lock = threading.Lock()
+
+def coarse_clock(unit='s', monotonic=False, interval=0.05):
+    """
+    Returns a started CoarseClock shared by all the callers with the same
+    arguments, so that each client does not need its own ticker thread.
+    """
+    key = (unit, monotonic, interval)
+    with _coarse_lock:
+        clock = _coarse_clocks.get(key)
+        if clock is None:
+            clock = CoarseClock(Clock(unit, monotonic), interval)
+            clock.start()
+            _coarse_clocks[key] = clock
+    return clock
@@ -0,0 +1,123 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Reliable delivery of the data sent to a Gephi master that may be unavailable.
+"""
+
+import os
+import time
+
+class CircuitOpenError(IOError):
+    pass
+
+class CircuitBreaker(object):
+    """
+    Stops sending after threshold consecutive failures, so that a master that
+    is down is not waited for on every flush. After reset seconds, one trial
+    is let through, and a success closes the circuit again.
+    """
+    
+    def __init__(self, threshold=None, reset=30.0):
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened = None
+        
+    def allow(self, now=None):
+        if self.opened is None:
+            return True
+        if now is None:
+            now = time.time()
+        if now - self.opened < self.reset:
+            return False
+        self.opened = now
+        return True
+    
+    def success(self):
+        self.failures = 0
+        self.opened = None
+        
+    def failure(self, now=None):
+        self.failures += 1
+        if self.threshold is not None and self.failures >= self.threshold:
+            self.opened = time.time() if now is None else now
+            
+class Spool(object):
+    """
+    Append-only file holding the data that could not be sent, in the order
+    it was produced. The read offset is kept in path.offset, so that a
+    restarted feeder resumes the drain where it stopped; the file is
+    truncated once it is completely drained.
+    """
+    
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.offset_path = path + '.offset'
+        self.fsync = fsync
+        self.out = open(path, 'ab')
+        self.out.seek(0, os.SEEK_END)
+        self.size = self.out.tell()
+        self.offset = 0
+        if os.path.exists(self.offset_path):
+            with open(self.offset_path) as f:
+                self.offset = min(int(f.read() or 0), self.size)
+                
+    def pending(self):
+        return self.size - self.offset
+    
+    def append(self, data):
+        self.out.write(data)
+        self.out.flush()
+        if self.fsync:
+            os.fsync(self.out.fileno())
+        self.size += len(data)
+        
+    def read(self, max_bytes):
+        """
+        Reads up to max_bytes of pending data, ending at an event boundary.
+        An event longer than max_bytes is returned whole.
+        """
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(min(max_bytes, self.pending()))
+            if self.offset + len(chunk) == self.size:
+                return chunk
+            end = chunk.rfind('\r\n')
+            if end >= 0:
+                return chunk[:end + 2]
+            while True:
+                more = f.read(max_bytes)
+                if not more:
+                    return chunk
+                chunk += more
+                end = chunk.find('\r\n')
+                if end >= 0:
+                    return chunk[:end + 2]
+        
+    def commit(self, length):
+        self.offset += length
+        if self.offset >= self.size:
+            self.out.seek(0)
+            self.out.truncate()
+            self.size = self.offset = 0
+        with open(self.offset_path, 'w') as f:
+            f.write(str(self.offset))
+            
+    def close(self):
+        self.out.close()
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Filters on the graph sent to streaming clients.
+"""
+
+class DegreeFilter(object):
+    """
+    Keeps incremental degree counts and holds back nodes until their degree
+    reaches min_degree, and edges until both their nodes did.
+    Nodes stay shown once they reached min_degree, until discarded.
+    
+    add_edge() returns the nodes that just reached min_degree and the data
+    of the held back edges that can now be sent, including the new edge.
+    Only held back edges are kept: a released edge is forgotten, and
+    remove_edge() ignores it, as it no longer affects what is held back.
+    """
+    
+    def __init__(self, min_degree):
+        self.min_degree = min_degree
+        self.degree = {}
+        self.passed = set()
+        self.edges = {}
+        self.node_edges = {}
+        
+    def add_edge(self, edge_id, source, target, data):
+        if edge_id in self.edges:
+            return (), ()
+        degree = self.degree
+        passed = self.passed
+        for node_id in (source, target):
+            degree[node_id] = degree.get(node_id, 0) + 1
+        
+        new_nodes = []
+        for node_id in set((source, target)):
+            if node_id not in passed and degree[node_id] >= self.min_degree:
+                passed.add(node_id)
+                new_nodes.append(node_id)
+                
+        edges = self.edges
+        node_edges = self.node_edges
+        released = []
+        if source in passed and target in passed:
+            released.append(data)
+        else:
+            edges[edge_id] = (source, target, data)
+            for node_id in (source, target):
+                node_edges.setdefault(node_id, set()).add(edge_id)
+        for node_id in new_nodes:
+            # catch up with the held back edges between nodes that passed
+            for held_id in list(node_edges.get(node_id, ())):
+                held = edges[held_id]
+                if held[0] in passed and held[1] in passed:
+                    released.append(held[2])
+                    del edges[held_id]
+                    self._unlink(held[0], held_id)
+                    self._unlink(held[1], held_id)
+        return new_nodes, released
+    
+    def remove_edge(self, edge_id):
+        edge = self.edges.pop(edge_id, None)
+        if edge is None:
+            return
+        for node_id in (edge[0], edge[1]):
+            self._detach(node_id, edge_id)
+            
+    def discard_node(self, node_id):
+        """
+        Forgets a node that was deleted, together with its edges.
+        """
+        for edge_id in self.node_edges.pop(node_id, ()):
+            edge = self.edges.pop(edge_id)
+            for other in (edge[0], edge[1]):
+                if other != node_id:
+                    self._detach(other, edge_id)
+        self.degree.pop(node_id, None)
+        self.passed.discard(node_id)
+        
+    def _detach(self, node_id, edge_id):
+        degree = self.degree
+        if node_id not in degree:
+            return
+        degree[node_id] -= 1
+        if degree[node_id] <= 0:
+            del degree[node_id]
+        self._unlink(node_id, edge_id)
+        
+    def _unlink(self, node_id, edge_id):
+        edges = self.node_edges.get(node_id)
+        if edges is not None:
+            edges.discard(edge_id)
+            if not edges:
+                del self.node_edges[node_id]
@@ -0,0 +1,417 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Graph statistics maintained incrementally as the graph changes.
+"""
+
+import time
+
+class GraphStats(object):
+    """
+    Keeps in/out-degree, weighted degree, an approximate PageRank and the
+    weakly connected component of every node up to date with each change.
+    
+    PageRank is computed by pushing residuals (Gauss-Seidel style), and is
+    scaled so that it averages 1 on graphs without sinks. A node only
+    propagates its rank to its neighbours again when it changed by more than
+    tolerance (relative), so updates around high-degree nodes are amortized.
+    With reverse set, rank flows from the targets to the sources of edges.
+    Components are exact while edges are only added; removals mark them as
+    stale, and they are recomputed on the next changes() call.
+    """
+    
+    def __init__(self, damping=0.85, tolerance=0.05, epsilon=1e-3, reverse=False):
+        self.reverse = reverse
+        self.damping = damping
+        self.tolerance = tolerance
+        self.epsilon = epsilon
+        self.out_edges = {}
+        self.in_edges = {}
+        self.edge_count = {}
+        self.indegree = {}
+        self.outdegree = {}
+        self.weighted_degree = {}
+        self.out_weight = {}
+        self.rank = {}
+        self.residual = {}
+        self.flow = {}
+        self.parent = {}
+        self.members = {}
+        self.components_stale = False
+        self.pending = set()
+        self.dirty = set()
+        self.reported = {}
+        
+    def __len__(self):
+        return len(self.out_edges)
+        
+    def __contains__(self, node_id):
+        return node_id in self.out_edges
+        
+    def add_node(self, node_id):
+        if node_id in self.out_edges:
+            return
+        self.out_edges[node_id] = {}
+        self.in_edges[node_id] = {}
+        self.indegree[node_id] = 0
+        self.outdegree[node_id] = 0
+        self.weighted_degree[node_id] = 0.0
+        self.out_weight[node_id] = 0.0
+        self.rank[node_id] = 0.0
+        self.residual[node_id] = 1.0 - self.damping
+        self.flow[node_id] = 0.0
+        self.parent[node_id] = node_id
+        self.members[node_id] = [node_id]
+        self.pending.add(node_id)
+        self.dirty.add(node_id)
+        
+    def add_edge(self, source, target, weight=1.0):
+        if self.reverse:
+            source, target = target, source
+        self.add_node(source)
+        self.add_node(target)
+        out = self.out_edges[source]
+        out[target] = out.get(target, 0.0) + weight
+        into = self.in_edges[target]
+        into[source] = into.get(source, 0.0) + weight
+        pair = (source, target)
+        self.edge_count[pair] = self.edge_count.get(pair, 0) + 1
+        self.outdegree[source] += 1
+        self.indegree[target] += 1
+        self.weighted_degree[source] += weight
+        self.weighted_degree[target] += weight
+        self.out_weight[source] += weight
+        self.residual[target] += self.damping*self.flow[source]*weight
+        self.pending.add(source)
+        self.pending.add(target)
+        self.dirty.add(source)
+        self.dirty.add(target)
+        if not self.components_stale:
+            self._union(source, target)
+            
+    def remove_edge(self, source, target, weight=1.0):
+        if self.reverse:
+            source, target = target, source
+        out = self.out_edges.get(source)
+        if out is None or target not in out:
+            return
+        out[target] -= weight
+        self.in_edges[target][source] -= weight
+        pair = (source, target)
+        self.edge_count[pair] -= 1
+        if not self.edge_count[pair]:
+            del self.edge_count[pair]
+            del out[target]
+            del self.in_edges[target][source]
+            self.components_stale = True
+        self.outdegree[source] -= 1
+        self.indegree[target] -= 1
+        self.weighted_degree[source] -= weight
+        self.weighted_degree[target] -= weight
+        self.out_weight[source] -= weight
+        self.residual[target] -= self.damping*self.flow[source]*weight
+        self.pending.add(source)
+        self.pending.add(target)
+        self.dirty.add(source)
+        self.dirty.add(target)
+        
+    def remove_node(self, node_id):
+        out = self.out_edges.pop(node_id, None)
+        if out is None:
+            return
+        damping = self.damping
+        flow = self.flow.pop(node_id)
+        for target, weight in out.iteritems():
+            count = self.edge_count.pop((node_id, target))
+            if target == node_id:
+                continue
+            del self.in_edges[target][node_id]
+            self.indegree[target] -= count
+            self.weighted_degree[target] -= weight
+            self.residual[target] -= damping*flow*weight
+            self.pending.add(target)
+            self.dirty.add(target)
+        for source, weight in self.in_edges.pop(node_id).iteritems():
+            if source == node_id:
+                continue
+            del self.out_edges[source][node_id]
+            self.outdegree[source] -= self.edge_count.pop((source, node_id))
+            self.weighted_degree[source] -= weight
+            self.out_weight[source] -= weight
+            self.pending.add(source)
+            self.dirty.add(source)
+        for d in (self.indegree, self.outdegree, self.weighted_degree,
+                  self.out_weight, self.rank, self.residual, self.reported):
+            d.pop(node_id, None)
+        self.pending.discard(node_id)
+        self.dirty.discard(node_id)
+        self.components_stale = True
+        
+    def settle(self, max_steps=None):
+        """
+        Pushes residuals until all of them are below epsilon,
+        or max_steps nodes were processed.
+        """
+        damping = self.damping
+        tolerance = self.tolerance
+        epsilon = self.epsilon
+        rank = self.rank
+        residual = self.residual
+        flow = self.flow
+        out_edges = self.out_edges
+        out_weight = self.out_weight
+        pending = self.pending
+        dirty = self.dirty
+        steps = 0
+        while pending and (max_steps is None or steps < max_steps):
+            steps += 1
+            node_id = pending.pop()
+            r = residual[node_id]
+            if r:
+                rank[node_id] += r
+                residual[node_id] = 0.0
+                dirty.add(node_id)
+            total = out_weight[node_id]
+            target = rank[node_id]/total if total > 0 else 0.0
+            delta = target - flow[node_id]
+            if abs(delta) <= tolerance*max(target, flow[node_id]):
+                continue
+            flow[node_id] = target
+            for neighbour, weight in out_edges[node_id].iteritems():
+                r = residual[neighbour] + damping*delta*weight
+                residual[neighbour] = r
+                if abs(r) > epsilon:
+                    pending.add(neighbour)
+                    
+    def component(self, node_id):
+        parent = self.parent
+        root = parent[node_id]
+        while parent[root] != root:
+            root = parent[root]
+        return root
+        
+    def changes(self):
+        """
+        Returns the statistics of the nodes that changed since the last call,
+        as a dict of node id to attributes.
+        """
+        self.settle()
+        if self.components_stale:
+            self._rebuild_components()
+        reported = self.reported
+        tolerance = self.tolerance
+        changes = {}
+        for node_id in self.dirty:
+            rank = self.rank[node_id]
+            last = reported.get(node_id)
+            stats = (self.indegree[node_id], self.outdegree[node_id],
+                     self.weighted_degree[node_id], self.component(node_id))
+            if self.reverse:
+                stats = (stats[1], stats[0]) + stats[2:]
+            if last is not None and last[1:] == stats and abs(rank - last[0]) <= tolerance*last[0]:
+                continue
+            reported[node_id] = (rank,) + stats
+            changes[node_id] = {'indegree':stats[0], 'outdegree':stats[1],
+                                'weighted_degree':stats[2], 'component':stats[3],
+                                'pagerank':rank}
+        self.dirty.clear()
+        return changes
+        
+    def _union(self, a, b):
+        root_a = self.component(a)
+        root_b = self.component(b)
+        if root_a == root_b:
+            return
+        members = self.members
+        if len(members[root_a]) < len(members[root_b]):
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        moved = members.pop(root_b)
+        members[root_a].extend(moved)
+        self.dirty.update(moved)
+        
+    def _rebuild_components(self):
+        old = dict((node_id, self.component(node_id)) for node_id in self.out_edges)
+        parent = {}
+        members = {}
+        out_edges = self.out_edges
+        in_edges = self.in_edges
+        for node_id in out_edges:
+            if node_id in parent:
+                continue
+            parent[node_id] = node_id
+            component = [node_id]
+            stack = [node_id]
+            while stack:
+                current = stack.pop()
+                for neighbours in (out_edges[current], in_edges[current]):
+                    for neighbour in neighbours:
+                        if neighbour not in parent:
+                            parent[neighbour] = node_id
+                            component.append(neighbour)
+                            stack.append(neighbour)
+            members[node_id] = component
+        self.parent = parent
+        self.members = members
+        self.components_stale = False
+        for node_id, root in old.iteritems():
+            if parent[node_id] != root:
+                self.dirty.add(node_id)
+
+class StatsUpdate(object):
+    """
+    Dispatched to the clients of the streaming servers with the statistics
+    that changed. nodes is a list of (node id, index, attributes) tuples.
+    """
+    
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+class GraphStatsClient(object):
+    """
+    Wraps a JSONClient, keeping GraphStats of the graph sent through it.
+    The changed statistics are sent as node attributes in one 'cn' event,
+    at most every interval seconds and on flush().
+    Other parameters are passed to GraphStats.
+    """
+    
+    def __init__(self, client, interval=1.0, **params):
+        self.client = client
+        self.params = params
+        self.stats = GraphStats(**params)
+        self.interval = interval
+        self.last_publish = time.time()
+        self.edges = {}
+        self.node_edges = {}
+        
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+        
+    def add_node(self, id, flush=True, **attributes):
+        self.stats.add_node(id)
+        self.client.add_node(id, **attributes)
+        self.publish()
+        
+    def add_nodes(self, nodes, t=None):
+        for id in nodes:
+            self.stats.add_node(id)
+        self.client.add_nodes(nodes, t)
+        self.publish()
+        
+    def delete_node(self, id):
+        self._delete_node(id)
+        self.client.delete_node(id)
+        self.publish()
+        
+    def delete_nodes(self, ids, t=None):
+        ids = list(ids)
+        for id in ids:
+            self._delete_node(id)
+        self.client.delete_nodes(ids, t)
+        self.publish()
+        
+    def add_edge(self, id, source, target, directed=True, **attributes):
+        self._add_edge(id, source, target, attributes.get('weight', 1.0))
+        self.client.add_edge(id, source, target, directed, **attributes)
+        self.publish()
+        
+    def add_edges(self, edges, t=None):
+        for id, attributes in edges.iteritems():
+            self._add_edge(id, attributes['source'], attributes['target'],
+                           attributes.get('weight', 1.0))
+        self.client.add_edges(edges, t)
+        self.publish()
+        
+    def change_edge(self, id, **attributes):
+        self._change_edge(id, attributes)
+        self.client.change_edge(id, **attributes)
+        self.publish()
+        
+    def change_edges(self, edges, t=None):
+        for id, attributes in edges.iteritems():
+            self._change_edge(id, attributes)
+        self.client.change_edges(edges, t)
+        self.publish()
+        
+    def delete_edge(self, id):
+        self._delete_edge(id)
+        self.client.delete_edge(id)
+        self.publish()
+        
+    def delete_edges(self, ids, t=None):
+        ids = list(ids)
+        for id in ids:
+            self._delete_edge(id)
+        self.client.delete_edges(ids, t)
+        self.publish()
+        
+    def clean(self):
+        self.stats = GraphStats(**self.params)
+        self.edges = {}
+        self.node_edges = {}
+        self.client.clean()
+        
+    def _delete_node(self, id):
+        # the edges of a deleted node are deleted with it
+        for edge_id in list(self.node_edges.get(id, ())):
+            self._delete_edge(edge_id)
+        self.stats.remove_node(id)
+        
+    def _add_edge(self, id, source, target, weight):
+        old = self._forget_edge(id)
+        if old is not None:
+            self.stats.remove_edge(*old)
+        self.edges[id] = (source, target, weight)
+        self.node_edges.setdefault(source, set()).add(id)
+        self.node_edges.setdefault(target, set()).add(id)
+        self.stats.add_edge(source, target, weight)
+        
+    def _forget_edge(self, id):
+        edge = self.edges.pop(id, None)
+        if edge is not None:
+            for node_id in edge[:2]:
+                edges = self.node_edges.get(node_id)
+                if edges is not None:
+                    edges.discard(id)
+                    if not edges:
+                        del self.node_edges[node_id]
+        return edge
+        
+    def _change_edge(self, id, attributes):
+        edge = self.edges.get(id)
+        if edge is not None and 'weight' in attributes:
+            self._add_edge(id, edge[0], edge[1], attributes['weight'])
+            
+    def _delete_edge(self, id):
+        edge = self._forget_edge(id)
+        if edge is not None:
+            self.stats.remove_edge(*edge)
+        
+    def publish(self, force=False):
+        now = time.time()
+        if not force and now - self.last_publish < self.interval:
+            return
+        self.last_publish = now
+        changes = self.stats.changes()
+        if changes:
+            self.client.change_nodes(changes)
+            
+    def flush(self):
+        self.publish(force=True)
+        self.client.flush()
@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Counters, gauges and histograms exposed in the Prometheus text format.
+"""
+
+import bisect
+import threading
+
+class Counter(object):
+    
+    def __init__(self):
+        self.value = 0
+        
+    def inc(self, amount=1):
+        self.value += amount
+        
+    def collect(self, name, labels):
+        return ['%s%s %s' % (name, labels, _format(self.value))]
+    
+    def stats(self):
+        return self.value
+
+class Gauge(object):
+    """
+    A value that is set, or read from function when collected.
+    """
+    
+    def __init__(self, function=None):
+        self.value = 0
+        self.function = function
+        
+    def set(self, value):
+        self.value = value
+        
+    def get(self):
+        if self.function is not None:
+            return self.function()
+        return self.value
+        
+    def collect(self, name, labels):
+        return ['%s%s %s' % (name, labels, _format(self.get()))]
+    
+    def stats(self):
+        return self.get()
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram(object):
+    
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0]*(len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        
+    def collect(self, name, labels):
+        lines = []
+        cumulative = 0
+        inner = labels[1:-1] + ',' if labels else ''
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append('%s_bucket{%sle="%s"} %d' % (name, inner, bound, cumulative))
+        lines.append('%s_sum%s %s' % (name, labels, _format(self.sum)))
+        lines.append('%s_count%s %d' % (name, labels, self.count))
+        return lines
+    
+    def stats(self):
+        return {'count':self.count, 'sum':self.sum,
+                'buckets':dict(zip(self.buckets + ('+Inf',), self.counts))}
+
+def _format(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                             for k, v in sorted(labels.iteritems()))
+
+class Metrics(object):
+    """
+    Registry of named metrics, each of which can have one child per set of labels.
+    Clients and servers only record anything when given a Metrics instance.
+    """
+    
+    def __init__(self):
+        self.families = {}
+        self.lock = threading.Lock()
+        
+    def _child(self, kind, name, help, labels, factory):
+        key = tuple(sorted(labels.iteritems()))
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = (kind, help, {})
+            children = family[2]
+            child = children.get(key)
+            if child is None:
+                child = children[key] = factory()
+            return child
+        
+    def counter(self, name, help='', **labels):
+        return self._child('counter', name, help, labels, Counter)
+    
+    def gauge(self, name, help='', function=None, **labels):
+        return self._child('gauge', name, help, labels, lambda: Gauge(function))
+    
+    def histogram(self, name, help='', buckets=DEFAULT_BUCKETS, **labels):
+        return self._child('histogram', name, help, labels, lambda: Histogram(buckets))
+    
+    def remove(self, **labels):
+        """
+        Removes the children of all metrics having these labels,
+        e.g. when a client disconnects.
+        """
+        items = set(labels.iteritems())
+        with self.lock:
+            for _, _, children in self.families.itervalues():
+                for key in children.keys():
+                    if items.issubset(key):
+                        del children[key]
+                        
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            families = sorted((name, family[0], family[1], family[2].items())
+                              for name, family in self.families.iteritems())
+        for name, kind, help, children in families:
+            if help:
+                lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for key, child in children:
+                lines.extend(child.collect(name, _labels(dict(key))))
+        return '\n'.join(lines) + '\n'
+    
+    def stats(self):
+        """
+        Returns all metrics as a dict of name to {labels: value}.
+        """
+        with self.lock:
+            return dict((name, dict((key, child.stats()) for key, child in family[2].items()))
+                        for name, family in self.families.iteritems())
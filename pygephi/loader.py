@@ -0,0 +1,255 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Bulk loading of static graph files into Gephi.
+
+The readers yield ('node', id, attributes) items followed by
+('edge', id, source, target, attributes) items, reading their file lazily.
+"""
+
+import csv
+import time
+from xml.etree import cElementTree
+from client import json
+
+GEXF_TYPES = {'integer': int, 'long': long, 'float': float, 'double': float,
+              'boolean': lambda v: v.lower() == 'true'}
+
+def _tag(element):
+    return element.tag.rsplit('}', 1)[-1]
+
+def read_gexf(path):
+    """
+    Reads a GEXF file with iterparse, removing each node and edge from the
+    tree once read. Labels, attribute values (by title), and the viz color,
+    size and position are kept; colors are scaled to [0, 1] as Gephi
+    expects. Edges get 'directed' only when the file declares their type,
+    with the graph defaultedgetype or the edge type.
+    """
+    titles = {}
+    types = {}
+    attribute_class = None
+    containers = []
+    directed = None
+    edge_index = 0
+    context = cElementTree.iterparse(path, events=('start', 'end'))
+    for event, element in context:
+        tag = _tag(element)
+        if event == 'start':
+            if tag == 'graph':
+                edge_type = element.get('defaultedgetype')
+                if edge_type is not None:
+                    directed = edge_type == 'directed'
+            elif tag == 'attributes':
+                attribute_class = element.get('class')
+            elif tag in ('nodes', 'edges'):
+                containers.append(element)
+            continue
+        if tag == 'attribute':
+            key = (attribute_class, element.get('id'))
+            titles[key] = element.get('title', element.get('id'))
+            types[key] = GEXF_TYPES.get(element.get('type'), unicode)
+        elif tag == 'node':
+            attributes = _gexf_attributes(element, 'node', titles, types)
+            yield ('node', element.get('id'), attributes)
+            containers[-1].remove(element)
+        elif tag == 'edge':
+            attributes = _gexf_attributes(element, 'edge', titles, types)
+            if element.get('weight') is not None:
+                attributes['weight'] = float(element.get('weight'))
+            edge_type = element.get('type')
+            if edge_type is not None:
+                attributes['directed'] = edge_type == 'directed'
+            elif directed is not None:
+                attributes['directed'] = directed
+            edge_id = element.get('id')
+            if edge_id is None:
+                edge_id = str(edge_index)
+            edge_index += 1
+            yield ('edge', edge_id, element.get('source'), element.get('target'), attributes)
+            containers[-1].remove(element)
+        elif tag in ('nodes', 'edges'):
+            containers.pop()
+            
+def _gexf_attributes(element, attribute_class, titles, types):
+    attributes = {}
+    if element.get('label') is not None:
+        attributes['label'] = element.get('label')
+    for child in element:
+        tag = _tag(child)
+        if tag == 'attvalues':
+            for value in child:
+                attribute_id = value.get('for', value.get('id'))
+                key = (attribute_class, attribute_id)
+                title = titles.get(key, attribute_id)
+                try:
+                    attributes[title] = types.get(key, unicode)(value.get('value'))
+                except ValueError:
+                    attributes[title] = value.get('value')
+        elif tag == 'color':
+            for c in ('r', 'g', 'b'):
+                attributes[c] = int(child.get(c, 0))/255.
+        elif tag == 'size':
+            attributes['size'] = float(child.get('value'))
+        elif tag == 'position':
+            for c in ('x', 'y', 'z'):
+                if child.get(c) is not None:
+                    attributes[c] = float(child.get(c))
+    return attributes
+
+def _number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def read_csv(path, nodes_path=None, delimiter=','):
+    """
+    Reads edges from a CSV file with a header naming the source and target
+    columns, and optionally id; the other columns become edge attributes,
+    as numbers when they parse as such. Nodes are read from nodes_path, a
+    CSV file with an id column, or else collected in a first pass over the
+    edges.
+    """
+    if nodes_path is not None:
+        with open(nodes_path, 'rb') as f:
+            for row in csv.DictReader(f, delimiter=delimiter):
+                node_id = row.pop('id')
+                yield ('node', node_id, dict((k, _number(v)) for k, v in row.iteritems()))
+    else:
+        with open(path, 'rb') as f:
+            for node_id in _unique_nodes((row['source'], row['target'])
+                                         for row in csv.DictReader(f, delimiter=delimiter)):
+                yield ('node', node_id, {})
+    with open(path, 'rb') as f:
+        for index, row in enumerate(csv.DictReader(f, delimiter=delimiter)):
+            source = row.pop('source')
+            target = row.pop('target')
+            edge_id = row.pop('id', None) or str(index)
+            yield ('edge', edge_id, source, target, dict((k, _number(v)) for k, v in row.iteritems()))
+            
+def read_edge_list(path):
+    """
+    Reads a whitespace separated 'source target [weight]' file, skipping
+    empty lines and # comments. Nodes are collected in a first pass.
+    """
+    def pairs():
+        with open(path, 'rb') as f:
+            for line in f:
+                fields = line.split()
+                if fields and not fields[0].startswith('#'):
+                    yield fields
+    for node_id in _unique_nodes(fields[:2] for fields in pairs()):
+        yield ('node', node_id, {})
+    for index, fields in enumerate(pairs()):
+        attributes = {}
+        if len(fields) > 2:
+            attributes['weight'] = float(fields[2])
+        yield ('edge', str(index), fields[0], fields[1], attributes)
+        
+def _unique_nodes(pairs):
+    seen = set()
+    for pair in pairs:
+        for node_id in pair:
+            if node_id not in seen:
+                seen.add(node_id)
+                yield node_id
+                
+READERS = {'gexf': read_gexf, 'csv': read_csv, 'edgelist': read_edge_list}
+
+class BulkLoader(object):
+    """
+    Sends nodes and edges to a client in multi-entity an/ae events of about
+    batch_bytes bytes each, flushing the client every flush_bytes.
+    
+    The size of an entity is estimated from the encoding of a sample batch
+    every calibrate_every batches, so that entities are only encoded once
+    by the client. progress(nodes, edges, seconds) is called after each
+    flush.
+    """
+    
+    def __init__(self, client, batch_bytes=64*1024, flush_bytes=1024*1024, directed=True,
+                 progress=None, calibrate_every=16):
+        self.client = client
+        self.batch_bytes = batch_bytes
+        self.flush_bytes = flush_bytes
+        self.directed = directed
+        self.progress = progress
+        self.calibrate_every = calibrate_every
+        self.entity_bytes = {'an': 64.0, 'ae': 96.0}
+        self.batches = 0
+        self.pending = {}
+        self.pending_type = None
+        self.unflushed = 0
+        self.nodes = 0
+        self.edges = 0
+        self.start = time.time()
+        
+    def load(self, items):
+        for item in items:
+            if item[0] == 'node':
+                self.add_node(item[1], item[2])
+            else:
+                self.add_edge(item[1], item[2], item[3], item[4])
+        self.finish()
+        
+    def add_node(self, node_id, attributes):
+        self._add('an', node_id, attributes)
+        self.nodes += 1
+        
+    def add_edge(self, edge_id, source, target, attributes):
+        attributes['source'] = source
+        attributes['target'] = target
+        attributes.setdefault('directed', self.directed)
+        self._add('ae', edge_id, attributes)
+        self.edges += 1
+        
+    def _add(self, etype, entity_id, attributes):
+        if etype != self.pending_type:
+            self._send_batch()
+            self.pending_type = etype
+        self.pending[entity_id] = attributes
+        if len(self.pending)*self.entity_bytes[etype] >= self.batch_bytes:
+            self._send_batch()
+            
+    def _send_batch(self):
+        if not self.pending:
+            return
+        etype, entities = self.pending_type, self.pending
+        self.pending = {}
+        if self.batches % self.calibrate_every == 0:
+            self.entity_bytes[etype] = float(len(json.dumps(entities)))/len(entities)
+        self.batches += 1
+        if etype == 'an':
+            self.client.add_nodes(entities)
+        else:
+            self.client.add_edges(entities)
+        self.unflushed += len(entities)*self.entity_bytes[etype]
+        if self.unflushed >= self.flush_bytes:
+            self._flush()
+            
+    def _flush(self):
+        self.client.flush()
+        self.unflushed = 0
+        if self.progress is not None:
+            self.progress(self.nodes, self.edges, time.time() - self.start)
+            
+    def finish(self):
+        self._send_batch()
+        self._flush()
@@ -0,0 +1,218 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Reading of streams in the Graph Streaming format, as sent by a Gephi master
+with ?operation=getGraph or by the streaming servers.
+"""
+
+from collections import namedtuple
+from client import json
+
+EVENT_TYPES = ('an', 'cn', 'dn', 'ae', 'ce', 'de')
+
+class GraphEvent(namedtuple('GraphEvent', 'type id attributes t')):
+    """
+    One change to one node or edge. Events with several entities are split
+    in one GraphEvent per entity. A deletion of all nodes
+    ({"dn":{"filter":"ALL"}}) has id None and the filter as attributes.
+    """
+    __slots__ = ()
+
+class GraphStreamReader(object):
+    """
+    Decodes a stream incrementally. Data can be passed to feed(), or read
+    from source: a socket (read into a reusable buffer of read_size bytes),
+    a file (read read_size bytes at a time) or another file-like object,
+    such as an HTTP response (read line by line). Lines are separated by \\r\\n,
+    \\r or \\n, and a line split between two reads is completed by the next.
+    Malformed lines are counted in errors and skipped, unless strict is set.
+    """
+    
+    def __init__(self, source=None, batch_size=1000, read_size=64*1024, strict=False):
+        self.source = source
+        self.batch_size = batch_size
+        self.read_size = read_size
+        self.strict = strict
+        self.pending = ''
+        self.errors = 0
+        
+    def feed(self, data):
+        """
+        Decodes data and returns the list of the events it completes.
+        """
+        if self.pending:
+            data = self.pending + data
+        lines = data.replace('\r', '\n').split('\n')
+        self.pending = lines.pop()
+        events = []
+        loads = json.loads
+        for line in lines:
+            if not line or line.isspace():
+                continue
+            try:
+                event = loads(line)
+                self._expand(event, events)
+            except (ValueError, TypeError, AttributeError):
+                self.errors += 1
+                if self.strict:
+                    raise ValueError("Malformed event: %r" % line)
+        return events
+    
+    def _expand(self, event, events):
+        t = event.get('t')
+        for etype in EVENT_TYPES:
+            entities = event.get(etype)
+            if entities is None:
+                continue
+            if etype == 'dn' and 'filter' in entities:
+                events.append(GraphEvent(etype, None, entities, t))
+                continue
+            for entity_id, attributes in entities.iteritems():
+                events.append(GraphEvent(etype, entity_id, attributes, t))
+    
+    def close(self):
+        """
+        Decodes the last line if the stream did not end with a separator.
+        """
+        data, self.pending = self.pending, ''
+        return self.feed(data + '\n') if data else []
+        
+    def _chunks(self):
+        source = self.source
+        if hasattr(source, 'recv_into'):
+            buf = bytearray(self.read_size)
+            view = memoryview(buf)
+            while True:
+                n = source.recv_into(buf)
+                if not n:
+                    break
+                yield view[:n].tobytes()
+        elif isinstance(source, file):
+            for chunk in iter(lambda: source.read(self.read_size), ''):
+                yield chunk
+        else:
+            for line in iter(source.readline, ''):
+                yield line
+                
+    def batches(self):
+        """
+        Yields the events decoded from each read of the source, in lists of
+        up to batch_size events, so that an idle stream does not hold back
+        the events already received.
+        """
+        size = self.batch_size
+        for chunk in self._chunks():
+            events = self.feed(chunk)
+            for i in xrange(0, len(events), size):
+                yield events[i:i + size]
+        events = self.close()
+        if events:
+            yield events
+    
+    def __iter__(self):
+        for batch in self.batches():
+            for event in batch:
+                yield event
+                
+class StreamGraph(object):
+    """
+    In-memory graph built by applying the events of a stream. Nodes map
+    their id to their attributes, and edges their id to a (source, target,
+    attributes) list. Attributes are None until the first non-empty update,
+    and ids are interned when they are byte strings.
+    """
+    
+    def __init__(self):
+        self.nodes = {}
+        self.edges = {}
+        self.incident = {}
+        
+    def apply(self, event):
+        etype, entity_id, attributes, _ = event
+        if etype == 'an':
+            self._add_node(entity_id, attributes)
+        elif etype == 'cn':
+            if entity_id in self.nodes:
+                self.nodes[entity_id] = self._update(self.nodes[entity_id], attributes)
+        elif etype == 'dn':
+            if entity_id is None:
+                self.clear()
+            else:
+                self._delete_node(entity_id)
+        elif etype == 'ae':
+            attributes = dict(attributes)
+            source = attributes.pop('source')
+            target = attributes.pop('target')
+            self._add_node(source, None)
+            self._add_node(target, None)
+            edge = self.edges.get(entity_id)
+            if edge is None:
+                self.edges[entity_id] = [source, target, attributes or None]
+                self.incident[source].add(entity_id)
+                self.incident[target].add(entity_id)
+            else:
+                edge[2] = self._update(edge[2], attributes)
+        elif etype == 'ce':
+            edge = self.edges.get(entity_id)
+            if edge is not None:
+                edge[2] = self._update(edge[2], attributes)
+        elif etype == 'de':
+            self._delete_edge(entity_id)
+            
+    def apply_batch(self, events):
+        apply = self.apply
+        for event in events:
+            apply(event)
+            
+    def clear(self):
+        self.nodes.clear()
+        self.edges.clear()
+        self.incident.clear()
+        
+    def _update(self, current, attributes):
+        if not attributes:
+            return current
+        if current is None:
+            return dict(attributes)
+        current.update(attributes)
+        return current
+    
+    def _add_node(self, node_id, attributes):
+        if node_id in self.nodes:
+            self.nodes[node_id] = self._update(self.nodes[node_id], attributes)
+            return
+        if isinstance(node_id, str):
+            node_id = intern(node_id)
+        self.nodes[node_id] = dict(attributes) if attributes else None
+        self.incident[node_id] = set()
+        
+    def _delete_node(self, node_id):
+        if node_id not in self.nodes:
+            return
+        for edge_id in list(self.incident[node_id]):
+            self._delete_edge(edge_id)
+        del self.nodes[node_id]
+        del self.incident[node_id]
+        
+    def _delete_edge(self, edge_id):
+        edge = self.edges.pop(edge_id, None)
+        if edge is None:
+            return
+        self.incident[edge[0]].discard(edge_id)
+        self.incident[edge[1]].discard(edge_id)
@@ -0,0 +1,149 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Shared bookkeeping of the nodes already sent to streaming clients.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+class NodeEviction(object):
+    """
+    Dispatched to the clients, in order with the other events, when nodes
+    are evicted from a NodeRegistry. nodes is a list of (node id, index) pairs.
+    """
+    
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+class NodeRegistry(object):
+    """
+    Maps node ids to small integer indexes shared by all clients, so that
+    each client only has to keep a bitset of the nodes it already knows.
+    With max_nodes or ttl (in seconds) set, the least recently used nodes
+    are evicted and their indexes reused.
+    """
+    
+    def __init__(self, max_nodes=None, ttl=None):
+        self.max_nodes = max_nodes
+        self.ttl = ttl
+        self.evicting = bool(max_nodes or ttl)
+        if self.evicting:
+            self.nodes = OrderedDict()
+        else:
+            self.nodes = {}
+        self.last_seen = []
+        self.free = []
+        self.lock = threading.Lock()
+        
+    def __len__(self):
+        return len(self.nodes)
+        
+    def intern(self, node_id, now=None):
+        with self.lock:
+            if self.evicting:
+                index = self.nodes.pop(node_id, None)
+            else:
+                index = self.nodes.get(node_id)
+            if index is None:
+                if self.free:
+                    index = self.free.pop()
+                else:
+                    index = len(self.last_seen)
+                    self.last_seen.append(0)
+            self.nodes[node_id] = index
+            if self.ttl:
+                self.last_seen[index] = now if now is not None else time.time()
+            return index
+        
+    def index(self, node_id):
+        """
+        Returns the index of a node, or None if it is not registered.
+        """
+        return self.nodes.get(node_id)
+        
+    def discard(self, node_id):
+        """
+        Removes a node, returning its index or None if it was not registered.
+        """
+        with self.lock:
+            index = self.nodes.pop(node_id, None)
+            if index is not None:
+                self.free.append(index)
+            return index
+        
+    def expire(self, now=None):
+        """
+        Evicts the nodes over the max_nodes limit or not seen for ttl seconds,
+        and returns them as a list of (node id, index) pairs.
+        """
+        evicted = []
+        if not self.evicting:
+            return evicted
+        with self.lock:
+            if self.max_nodes:
+                while len(self.nodes) > self.max_nodes:
+                    evicted.append(self.nodes.popitem(last=False))
+            if self.ttl:
+                if now is None:
+                    now = time.time()
+                limit = now - self.ttl
+                while self.nodes:
+                    node_id, index = next(self.nodes.iteritems())
+                    if self.last_seen[index] >= limit:
+                        break
+                    del self.nodes[node_id]
+                    evicted.append((node_id, index))
+            self.free.extend(index for _, index in evicted)
+        return evicted
+
+class KnownNodes(object):
+    """
+    Bitset of the registry indexes of the nodes already sent to a client.
+    """
+    
+    def __init__(self):
+        self.bits = bytearray()
+        
+    def __contains__(self, index):
+        byte = index >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (index & 7)))
+        
+    def add(self, index):
+        """
+        Marks the node as known, returning True if it was not known before.
+        """
+        byte, bit = index >> 3, 1 << (index & 7)
+        if byte >= len(self.bits):
+            self.bits.extend(bytearray(byte + 1 - len(self.bits)))
+        elif self.bits[byte] & bit:
+            return False
+        self.bits[byte] |= bit
+        return True
+    
+    def discard(self, index):
+        """
+        Marks the node as unknown, returning True if it was known before.
+        """
+        byte, bit = index >> 3, 1 << (index & 7)
+        if byte >= len(self.bits) or not self.bits[byte] & bit:
+            return False
+        self.bits[byte] &= ~bit & 0xff
+        return True
@@ -0,0 +1,297 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Writing one stream to several Gephi workspaces.
+"""
+
+import threading
+import Queue
+import time
+import zlib
+from client import JSONClient, GephiClient, json
+
+EVENT_TYPES = ('an', 'cn', 'dn', 'ae', 'ce', 'de')
+
+GHOST = {'ghost': True}
+
+def hash_partition(node_id, shards):
+    if isinstance(node_id, unicode):
+        node_id = node_id.encode('utf-8')
+    return zlib.crc32(str(node_id)) % shards
+
+def _fragment(entity_id, attributes):
+    if not isinstance(entity_id, basestring):
+        entity_id = str(entity_id)
+    return '%s: %s' % (json.dumps(entity_id), json.dumps(attributes))
+
+def _line(etype, fragments, extra):
+    return '{"%s": {%s}%s}\r\n' % (etype, ', '.join(fragments), extra)
+
+class ShardError(IOError):
+    """
+    Raised when shards fail. errors maps each failed shard to its error,
+    pending to the number of bytes kept to be sent before its next batch,
+    and dropped to the number of bytes dropped from its backlog.
+    """
+    
+    def __init__(self, errors, pending, dropped):
+        IOError.__init__(self, '; '.join(
+            'shard %d failed with %d bytes pending, %d dropped: %s'
+            % (shard, pending[shard], dropped[shard], errors[shard])
+            for shard in sorted(errors)))
+        self.errors = errors
+        self.pending = pending
+        self.dropped = dropped
+
+class ShardSender(threading.Thread):
+    """
+    Sends the data of one shard, so that all shards are written in parallel.
+    """
+    
+    def __init__(self, client):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.client = client
+        self.requests = Queue.Queue()
+        
+    def run(self):
+        while True:
+            data, results = self.requests.get()
+            try:
+                self.client._send(data)
+                results.put((self, None))
+            except Exception, e:
+                results.put((self, e))
+
+class ShardedGephiClient(JSONClient):
+    """
+    Writes one stream to several Gephi masters or workspaces, given as URLs
+    or as GephiClient instances (to configure retries or a spool for each).
+    
+    With mode 'replicate', every shard receives the whole stream. With mode
+    'partition', each node lives in the shard given by partition(node_id,
+    number of shards), a hash of its id by default, and each edge is sent to
+    the shards of its source and target, where the other end is added as a
+    ghost node (with the attribute ghost=True). Ghosts are deleted with the
+    node they stand for.
+    
+    Each event is encoded once, and the shards are sent to in parallel. If
+    some shards fail, their data is kept and sent before their next batch,
+    or on the next flush() even if nothing was added, up to max_pending
+    bytes per shard; a larger backlog is dropped. The other shards are not
+    affected. ShardError is raised when shards start failing or drop their
+    backlog, but not while they keep failing; their backlog is given by
+    pending(shard) and the pygephi_shard_pending_bytes metric. Use
+    GephiClient instances with a spool to keep all the data of a shard
+    while it is down.
+    """
+    
+    def __init__(self, clients, mode='replicate', partition=None, autoflush=False,
+                 max_pending=64*1024*1024, **params):
+        JSONClient.__init__(self, autoflush, **params)
+        if mode not in ('replicate', 'partition'):
+            raise ValueError("Unknown sharding mode: %s" % mode)
+        self.mode = mode
+        self.partition = partition or hash_partition
+        self.clients = [GephiClient(c) if isinstance(c, basestring) else c for c in clients]
+        self.senders = []
+        for client in self.clients:
+            sender = ShardSender(client)
+            sender.start()
+            self.senders.append(sender)
+        self.max_pending = max_pending
+        self.failed = {}
+        self.edge_shards = {}
+        self.node_edges = {}
+        self.ghosts = {}
+        if self.metrics is not None:
+            for shard in range(len(self.clients)):
+                labels = dict(self.metrics_labels, shard=str(shard))
+                self.metrics.gauge('pygephi_shard_pending_bytes',
+                                   'Bytes kept for a failed shard',
+                                   function=lambda shard=shard: self.pending(shard), **labels)
+        
+    def shard(self, node_id):
+        return self.partition(node_id, len(self.clients))
+    
+    def pending(self, shard):
+        """
+        Returns the number of bytes kept for a shard that failed.
+        """
+        return len(self.failed.get(shard, ''))
+    
+    def _buffer(self, event):
+        if self.mode == 'replicate':
+            JSONClient._buffer(self, event)
+            return
+        self.data.extend(self._route(event))
+            
+    def _route(self, event):
+        """
+        Splits an event into one line per shard. Each entity is encoded
+        once, and its encoding is shared by all the shards it goes to.
+        """
+        extra = ''.join(', %s: %s' % (json.dumps(k), json.dumps(v))
+                        for k, v in event.iteritems() if k not in EVENT_TYPES)
+        routed = []
+        for etype in EVENT_TYPES:
+            if etype not in event:
+                continue
+            entities = event[etype]
+            parts = {}
+            if etype == 'dn' and 'filter' in entities:
+                self.edge_shards.clear()
+                self.node_edges.clear()
+                self.ghosts.clear()
+                fragments = [_fragment(k, v) for k, v in entities.iteritems()]
+                parts = dict((shard, fragments) for shard in range(len(self.clients)))
+            elif etype in ('an', 'cn', 'dn'):
+                for node_id, attributes in entities.iteritems():
+                    fragment = _fragment(node_id, attributes)
+                    shards = [self.shard(node_id)]
+                    if etype == 'dn':
+                        shards.extend(self.ghosts.pop(node_id, ()))
+                        self._forget_node(node_id)
+                    for shard in shards:
+                        parts.setdefault(shard, []).append(fragment)
+            elif etype == 'ae':
+                ghosts = {}
+                for edge_id, attributes in entities.iteritems():
+                    fragment = _fragment(edge_id, attributes)
+                    source = attributes['source']
+                    target = attributes['target']
+                    shards = (self.shard(source),)
+                    if self.shard(target) != shards[0]:
+                        shards += (self.shard(target),)
+                        self._ghost(ghosts, shards[1], source)
+                        self._ghost(ghosts, shards[0], target)
+                    self._forget_edge(edge_id)
+                    self.edge_shards[edge_id] = (shards, source, target)
+                    self.node_edges.setdefault(source, set()).add(edge_id)
+                    self.node_edges.setdefault(target, set()).add(edge_id)
+                    for shard in shards:
+                        parts.setdefault(shard, []).append(fragment)
+                for shard, fragments in ghosts.iteritems():
+                    routed.append((shard, _line('an', fragments, extra)))
+            else:
+                for edge_id, attributes in entities.iteritems():
+                    fragment = _fragment(edge_id, attributes)
+                    if etype == 'de':
+                        entry = self._forget_edge(edge_id)
+                    else:
+                        entry = self.edge_shards.get(edge_id)
+                    if entry is None:
+                        shards = range(len(self.clients))
+                    else:
+                        shards = entry[0]
+                    for shard in shards:
+                        parts.setdefault(shard, []).append(fragment)
+            for shard, fragments in parts.iteritems():
+                routed.append((shard, _line(etype, fragments, extra)))
+        return routed
+    
+    def _ghost(self, ghosts, shard, node_id):
+        shards = self.ghosts.setdefault(node_id, set())
+        if shard not in shards:
+            shards.add(shard)
+            ghosts.setdefault(shard, []).append(_fragment(node_id, GHOST))
+            
+    def _forget_edge(self, edge_id):
+        entry = self.edge_shards.pop(edge_id, None)
+        if entry is not None:
+            for node_id in entry[1:]:
+                edges = self.node_edges.get(node_id)
+                if edges is not None:
+                    edges.discard(edge_id)
+                    if not edges:
+                        del self.node_edges[node_id]
+        return entry
+    
+    def _forget_node(self, node_id):
+        # Gephi deletes the edges of a deleted node
+        for edge_id in list(self.node_edges.get(node_id, ())):
+            self._forget_edge(edge_id)
+            
+    def flush(self):
+        if self.failed and not self.data and not self.events:
+            # nothing new, but the backlog of the failed shards is retried
+            self._flush_buffer(False)
+            return
+        JSONClient.flush(self)
+        
+    def _flush_buffer(self, traced):
+        if self.mode == 'replicate':
+            data = ''.join(self.data)
+            payloads = dict((shard, data) for shard in range(len(self.clients)))
+        else:
+            lines = {}
+            for shard, line in self.data:
+                lines.setdefault(shard, []).append(line)
+            payloads = dict((shard, ''.join(l)) for shard, l in lines.iteritems())
+        failing = self.failed
+        for shard, data in failing.iteritems():
+            payloads[shard] = data + payloads.get(shard, '')
+        self.failed = {}
+        self.data = []
+        
+        start = time.time()
+        errors = self._send_shards(payloads)
+        seconds = time.time() - start
+        if self.flush_seconds is not None:
+            self.flush_seconds.observe(seconds)
+            self.bytes_sent.inc(sum(len(data) for shard, data in payloads.iteritems()
+                                    if shard not in errors))
+        if traced:
+            self._trace('send', seconds)
+        raised = {}
+        pending = {}
+        dropped = {}
+        for shard, error in errors.iteritems():
+            data = payloads[shard]
+            if self.max_pending is not None and len(data) > self.max_pending:
+                pending[shard], dropped[shard] = 0, len(data)
+                raised[shard] = error
+            else:
+                self.failed[shard] = data
+                pending[shard], dropped[shard] = len(data), 0
+                if shard not in failing:
+                    raised[shard] = error
+        if raised:
+            if self.send_errors is not None:
+                self.send_errors.inc(len(raised))
+            raise ShardError(raised, dict((shard, pending[shard]) for shard in raised),
+                             dict((shard, dropped[shard]) for shard in raised))
+        
+    def _send_shards(self, payloads):
+        errors = {}
+        if len(payloads) == 1:
+            shard, data = payloads.items()[0]
+            try:
+                self.clients[shard]._send(data)
+            except Exception, e:
+                errors[shard] = e
+            return errors
+        results = Queue.Queue()
+        for shard, data in payloads.iteritems():
+            self.senders[shard].requests.put((data, results))
+        for _ in range(len(payloads)):
+            sender, error = results.get()
+            if error is not None:
+                errors[self.senders.index(sender)] = error
+        return errors
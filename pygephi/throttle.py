@@ -0,0 +1,60 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Rate limiting of the events sent to streaming clients.
+"""
+
+import time
+
+class RateLimiter(object):
+    """
+    Token bucket allowing max_eps events per second on average, with bursts
+    of up to burst events (by default, one second worth of events).
+    """
+    
+    def __init__(self, max_eps, burst=None):
+        self.rate = float(max_eps)
+        self.capacity = float(burst or max(1.0, max_eps))
+        self.tokens = self.capacity
+        self.last = time.time()
+        
+    def _refill(self, now):
+        if now is None:
+            now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last)*self.rate)
+        self.last = now
+        
+    def allow(self, cost=1, now=None):
+        """
+        Takes cost events from the budget if they fit in it, returning
+        whether they can be sent.
+        """
+        self._refill(now)
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+    
+    def consume(self, cost=1, now=None):
+        """
+        Takes cost events from the budget for events that have to be sent
+        anyway, such as deletions. The budget can become negative.
+        """
+        self._refill(now)
+        self.tokens -= cost
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Sliding time window over a stream of edges.
+"""
+
+import heapq
+
+class Expiry(object):
+    """
+    Dispatched to the clients when edges leave the window.
+    edges is a list of (edge id, source, target) tuples and nodes a list of
+    (node id, index) pairs of the nodes left without edges.
+    """
+    
+    def __init__(self, edges, nodes):
+        self.edges = edges
+        self.nodes = nodes
+
+class SlidingWindow(object):
+    """
+    Keeps the edges seen in the last window seconds in a min-heap keyed by
+    expiry time. Adding an edge that is already in the window extends it.
+    If a NodeRegistry is given, nodes left without edges are removed from it.
+    """
+    
+    def __init__(self, window, registry=None):
+        self.window = window
+        self.registry = registry
+        self.heap = []
+        self.edges = {}
+        self.degree = {}
+        
+    def __len__(self):
+        return len(self.edges)
+        
+    def add_edge(self, edge_id, source, target, now):
+        expires = now + self.window
+        edge = self.edges.get(edge_id)
+        if edge is None:
+            degree = self.degree
+            degree[source] = degree.get(source, 0) + 1
+            degree[target] = degree.get(target, 0) + 1
+        else:
+            source, target = edge[0], edge[1]
+        self.edges[edge_id] = (source, target, expires)
+        heapq.heappush(self.heap, (expires, edge_id))
+        
+    def expire(self, now):
+        """
+        Removes the edges that left the window, returning them and the
+        nodes left without edges as an Expiry, or None if nothing expired.
+        """
+        heap = self.heap
+        if not heap or heap[0][0] > now:
+            return None
+        edges = []
+        nodes = []
+        degree = self.degree
+        while heap and heap[0][0] <= now:
+            expires, edge_id = heapq.heappop(heap)
+            edge = self.edges.get(edge_id)
+            if edge is None or edge[2] != expires:
+                # stale entry of an edge that was extended
+                continue
+            del self.edges[edge_id]
+            source, target = edge[0], edge[1]
+            edges.append((edge_id, source, target))
+            for node_id in (source, target):
+                degree[node_id] -= 1
+                if degree[node_id] == 0:
+                    del degree[node_id]
+                    if self.registry is None:
+                        nodes.append((node_id, None))
+                    else:
+                        index = self.registry.discard(node_id)
+                        if index is not None:
+                            nodes.append((node_id, index))
+        if not edges:
+            return None
+        return Expiry(edges, nodes)
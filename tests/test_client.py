@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+from StringIO import StringIO
+
+from pygephi.client import GephiFileHandler
+
+def events(out):
+    return [json.loads(line) for line in out.getvalue().split('\r\n') if line]
+
+class JSONClientTest(unittest.TestCase):
+    
+    def test_deletes_are_buffered_in_order(self):
+        out = StringIO()
+        client = GephiFileHandler(out, autoflush=False)
+        client.add_node('a')
+        client.delete_node('a')
+        client.delete_edge('e1')
+        self.assertEqual(out.getvalue(), '')
+        client.flush()
+        self.assertEqual(events(out), [{'an': {'a': {}}}, {'dn': {'a': {}}},
+                                       {'de': {'e1': {}}}])
+        
+    def test_autoflush_sends_deletes_at_once(self):
+        out = StringIO()
+        client = GephiFileHandler(out)
+        client.delete_node('a')
+        self.assertEqual(events(out), [{'dn': {'a': {}}}])
+
+    def test_add_edges_copies_attributes(self):
+        out = StringIO()
+        client = GephiFileHandler(out)
+        edges = {'e1': {'source': 'a', 'target': 'b'},
+                 'e2': {'source': 'b', 'target': 'c', 'directed': False}}
+        client.add_edges(edges)
+        self.assertEqual(edges['e1'], {'source': 'a', 'target': 'b'})
+        sent = events(out)[0]['ae']
+        self.assertEqual(sent['e1']['directed'], True)
+        self.assertEqual(sent['e2']['directed'], False)
+        
+    def test_add_edges_requires_source_and_target(self):
+        client = GephiFileHandler(StringIO())
+        self.assertRaises(ValueError, client.add_edges, {'e1': {'source': 'a'}})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+import urllib2
+
+from pygephi.client import GephiClient
+from pygephi.delivery import CircuitBreaker, CircuitOpenError, Spool
+
+class FakeMaster(object):
+    """
+    Stands for GephiClient._post, failing with the queued errors first.
+    """
+    
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.received = []
+        
+    def __call__(self, data):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.received.append(data)
+        return ''
+
+def http_error(code):
+    return urllib2.HTTPError('http://127.0.0.1:8080/workspace0', code, 'error', {}, None)
+
+class CircuitBreakerTest(unittest.TestCase):
+    
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(2, reset=10.0)
+        breaker.failure(now=0.0)
+        self.assertTrue(breaker.allow(now=1.0))
+        breaker.failure(now=1.0)
+        self.assertFalse(breaker.allow(now=2.0))
+        # one trial after reset seconds
+        self.assertTrue(breaker.allow(now=11.0))
+        self.assertFalse(breaker.allow(now=12.0))
+        breaker.success()
+        self.assertTrue(breaker.allow(now=12.0))
+        
+    def test_never_opens_without_threshold(self):
+        breaker = CircuitBreaker()
+        for i in range(10):
+            breaker.failure(now=0.0)
+        self.assertTrue(breaker.allow(now=0.0))
+
+class SpoolTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'spool')
+        
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        
+    def test_read_ends_at_event_boundary(self):
+        spool = Spool(self.path)
+        spool.append('{"an":{"a":{}}}\r\n')
+        spool.append('{"an":{"b":{}}}\r\n')
+        self.assertEqual(spool.read(20), '{"an":{"a":{}}}\r\n')
+        # an event longer than max_bytes is read whole
+        self.assertEqual(spool.read(4), '{"an":{"a":{}}}\r\n')
+        self.assertEqual(spool.read(100), '{"an":{"a":{}}}\r\n{"an":{"b":{}}}\r\n')
+        spool.close()
+        
+    def test_commit_and_resume(self):
+        spool = Spool(self.path)
+        spool.append('a\r\nb\r\n')
+        spool.commit(3)
+        self.assertEqual(spool.pending(), 3)
+        spool.close()
+        spool = Spool(self.path)
+        self.assertEqual(spool.read(100), 'b\r\n')
+        spool.commit(3)
+        self.assertEqual(spool.pending(), 0)
+        self.assertEqual(os.path.getsize(self.path), 0)
+        spool.close()
+
+class GephiClientTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'spool')
+        
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        
+    def client(self, master, **params):
+        client = GephiClient(backoff=0, **params)
+        client._post = master
+        return client
+        
+    def test_retries(self):
+        master = FakeMaster(IOError('down'), http_error(503))
+        client = self.client(master, retries=2)
+        client.add_node('a')
+        client.flush()
+        self.assertEqual(len(master.received), 1)
+        
+    def test_client_error_is_not_retried(self):
+        master = FakeMaster(http_error(400))
+        client = self.client(master, retries=2, breaker_threshold=1)
+        client.add_node('a')
+        self.assertRaises(urllib2.HTTPError, client.flush)
+        self.assertEqual(master.received, [])
+        self.assertTrue(client.breaker.allow())
+        
+    def test_breaker_opens(self):
+        master = FakeMaster(IOError('down'))
+        client = self.client(master, breaker_threshold=1)
+        client.add_node('a')
+        self.assertRaises(IOError, client.flush)
+        client.add_node('b')
+        self.assertRaises(CircuitOpenError, client.flush)
+        
+    def test_spool_and_drain(self):
+        master = FakeMaster(IOError('down'))
+        client = self.client(master, spool=self.path)
+        client.add_node('a')
+        client.flush()
+        self.assertEqual(master.received, [])
+        self.assertTrue(client.spool.pending() > 0)
+        client.breaker.success()
+        self.assertTrue(client.drain())
+        self.assertEqual(len(master.received), 1)
+        self.assertTrue('"a"' in master.received[0])
+        client.spool.close()
+        
+    def test_client_error_is_not_spooled(self):
+        master = FakeMaster(http_error(404))
+        client = self.client(master, spool=self.path)
+        client.add_node('a')
+        self.assertRaises(urllib2.HTTPError, client.flush)
+        self.assertEqual(client.spool.pending(), 0)
+        client.spool.close()
+        
+    def test_drain_without_spool(self):
+        self.assertTrue(self.client(FakeMaster()).drain())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from pygephi.filters import DegreeFilter
+
+class DegreeFilterTest(unittest.TestCase):
+    
+    def test_holds_back_until_min_degree(self):
+        f = DegreeFilter(2)
+        self.assertEqual(f.add_edge('e1', 'a', 'b', 'd1'), ([], []))
+        new_nodes, released = f.add_edge('e2', 'a', 'c', 'd2')
+        self.assertEqual(new_nodes, ['a'])
+        self.assertEqual(released, [])
+        new_nodes, released = f.add_edge('e3', 'b', 'c', 'd3')
+        self.assertEqual(sorted(new_nodes), ['b', 'c'])
+        self.assertEqual(sorted(released), ['d1', 'd2', 'd3'])
+        
+    def test_released_edges_are_forgotten(self):
+        f = DegreeFilter(1)
+        for i in range(100):
+            new_nodes, released = f.add_edge(i, 'a', 'b', i)
+            self.assertEqual(released, [i])
+        self.assertEqual(f.edges, {})
+        self.assertEqual(f.node_edges, {})
+        f.remove_edge(5)
+        self.assertEqual(f.passed, set(['a', 'b']))
+        
+    def test_remove_held_edge(self):
+        f = DegreeFilter(2)
+        f.add_edge('e1', 'a', 'b', 'd1')
+        f.remove_edge('e1')
+        self.assertEqual(f.degree, {})
+        self.assertEqual(f.node_edges, {})
+        self.assertEqual(f.add_edge('e2', 'a', 'c', 'd2'), ([], []))
+        
+    def test_discard_node(self):
+        f = DegreeFilter(2)
+        f.add_edge('e1', 'a', 'b', 'd1')
+        f.add_edge('e2', 'a', 'c', 'd2')
+        f.discard_node('a')
+        self.assertFalse('a' in f.passed)
+        self.assertEqual(f.edges, {})
+        self.assertEqual(f.degree, {})
+        self.assertEqual(f.node_edges, {})
+        
+    def test_duplicate_held_edge(self):
+        f = DegreeFilter(3)
+        f.add_edge('e1', 'a', 'b', 'd1')
+        self.assertEqual(f.add_edge('e1', 'a', 'b', 'd1'), ((), ()))
+        self.assertEqual(f.degree['a'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
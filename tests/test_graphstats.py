@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from pygephi.graphstats import GraphStats, GraphStatsClient
+
+class Recorder(object):
+    
+    def __init__(self):
+        self.calls = []
+        
+    def __getattr__(self, name):
+        def record(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return record
+
+class GraphStatsTest(unittest.TestCase):
+    
+    def test_degrees(self):
+        stats = GraphStats()
+        stats.add_edge('a', 'b', 2.0)
+        stats.add_edge('a', 'c')
+        self.assertEqual(stats.outdegree['a'], 2)
+        self.assertEqual(stats.indegree['b'], 1)
+        self.assertEqual(stats.weighted_degree['a'], 3.0)
+        
+    def test_parallel_edges(self):
+        stats = GraphStats()
+        stats.add_edge('a', 'b')
+        stats.add_edge('a', 'b')
+        self.assertEqual(stats.outdegree['a'], 2)
+        stats.remove_edge('a', 'b')
+        self.assertEqual(stats.outdegree['a'], 1)
+        self.assertEqual(stats.indegree['b'], 1)
+        self.assertTrue('b' in stats.out_edges['a'])
+        stats.remove_edge('a', 'b')
+        self.assertEqual(stats.outdegree['a'], 0)
+        self.assertFalse('b' in stats.out_edges['a'])
+        
+    def test_zero_weight_edge(self):
+        stats = GraphStats()
+        stats.add_edge('a', 'b', 0.0)
+        stats.add_edge('a', 'b', 0.0)
+        stats.remove_edge('a', 'b', 0.0)
+        self.assertTrue('b' in stats.out_edges['a'])
+        self.assertEqual(stats.indegree['b'], 1)
+        
+    def test_remove_node_with_parallel_edges(self):
+        stats = GraphStats()
+        stats.add_edge('a', 'b')
+        stats.add_edge('a', 'b')
+        stats.add_edge('c', 'a')
+        stats.add_edge('c', 'a')
+        stats.add_edge('a', 'a')
+        stats.remove_node('a')
+        self.assertEqual(stats.indegree['b'], 0)
+        self.assertEqual(stats.outdegree['c'], 0)
+        self.assertEqual(stats.weighted_degree['b'], 0.0)
+        self.assertEqual(stats.edge_count, {})
+        
+    def test_components(self):
+        stats = GraphStats()
+        stats.add_edge('a', 'b')
+        stats.add_edge('c', 'd')
+        self.assertNotEqual(stats.component('a'), stats.component('c'))
+        stats.add_edge('b', 'c')
+        self.assertEqual(stats.component('a'), stats.component('d'))
+        stats.remove_edge('b', 'c')
+        changes = stats.changes()
+        self.assertNotEqual(changes['a']['component'], changes['d']['component'])
+        
+    def test_pagerank(self):
+        stats = GraphStats(tolerance=0.0, epsilon=1e-6)
+        for source, target in (('a', 'b'), ('b', 'c'), ('c', 'a'), ('d', 'a')):
+            stats.add_edge(source, target)
+        changes = stats.changes()
+        self.assertTrue(changes['a']['pagerank'] > changes['d']['pagerank'])
+        self.assertEqual(stats.changes(), {})
+
+class GraphStatsClientTest(unittest.TestCase):
+    
+    def test_delete_node_with_parallel_edges(self):
+        client = GraphStatsClient(Recorder(), interval=0)
+        client.add_edge('e1', 'a', 'b')
+        client.add_edge('e2', 'a', 'b')
+        client.add_edge('e3', 'b', 'c')
+        client.delete_node('a')
+        stats = client.stats
+        self.assertEqual(stats.indegree['b'], 0)
+        self.assertEqual(stats.outdegree['b'], 1)
+        self.assertFalse('a' in stats)
+        self.assertEqual(sorted(client.edges), ['e3'])
+        self.assertFalse('a' in client.node_edges)
+        
+    def test_change_edge_weight(self):
+        client = GraphStatsClient(Recorder(), interval=0)
+        client.add_edge('e1', 'a', 'b', weight=1.0)
+        client.change_edge('e1', weight=3.0)
+        self.assertEqual(client.stats.weighted_degree['b'], 3.0)
+        self.assertEqual(client.stats.indegree['b'], 1)
+        
+    def test_publish(self):
+        recorder = Recorder()
+        client = GraphStatsClient(recorder, interval=0)
+        client.add_edge('e1', 'a', 'b')
+        names = [call[0] for call in recorder.calls]
+        self.assertEqual(names, ['add_edge', 'change_nodes'])
+        self.assertEqual(recorder.calls[-1][1][0]['b']['indegree'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from pygephi.client import GephiFileHandler
+from pygephi.loader import BulkLoader, read_csv, read_edge_list, read_gexf
+from pygephi.reader import GraphStreamReader, StreamGraph
+
+GEXF = """<?xml version="1.0" encoding="UTF-8"?>
+<gexf xmlns="http://www.gexf.net/1.2draft" xmlns:viz="http://www.gexf.net/1.2draft/viz" version="1.2">
+  <graph defaultedgetype="undirected">
+    <attributes class="node">
+      <attribute id="0" title="age" type="integer"/>
+    </attributes>
+    <attributes class="edge">
+      <attribute id="0" title="kind" type="string"/>
+    </attributes>
+    <nodes>
+      <node id="a" label="A">
+        <attvalues><attvalue for="0" value="42"/></attvalues>
+        <viz:color r="255" g="0" b="0"/>
+        <viz:size value="3.0"/>
+      </node>
+      <node id="b" label="B"/>
+    </nodes>
+    <edges>
+      <edge id="e1" source="a" target="b" weight="2.5">
+        <attvalues><attvalue for="0" value="friend"/></attvalues>
+      </edge>
+      <edge source="b" target="a" type="directed"/>
+    </edges>
+  </graph>
+</gexf>
+"""
+
+class LoaderTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+    
+    def load(self, items, **params):
+        out = StringIO()
+        flushes = []
+        loader = BulkLoader(GephiFileHandler(out, autoflush=False),
+                            progress=lambda *args: flushes.append(args), **params)
+        loader.load(items)
+        graph = StreamGraph()
+        graph.apply_batch(GraphStreamReader(StringIO(out.getvalue())))
+        return graph, flushes
+    
+    def test_gexf(self):
+        graph, flushes = self.load(read_gexf(self.write('graph.gexf', GEXF)))
+        self.assertEqual(graph.nodes['a'], {'label': 'A', 'age': 42, 'r': 1.0,
+                                            'g': 0.0, 'b': 0.0, 'size': 3.0})
+        self.assertEqual(graph.nodes['b'], {'label': 'B'})
+        self.assertEqual(graph.edges['e1'], ['a', 'b', {'weight': 2.5, 'kind': 'friend',
+                                                        'directed': False}])
+        self.assertEqual(graph.edges['1'], ['b', 'a', {'directed': True}])
+        self.assertEqual(flushes[-1][:2], (2, 2))
+        
+    def test_csv(self):
+        edges = self.write('edges.csv', 'source,target,weight,kind\na,b,2,x\nb,c,1.5,y\n')
+        nodes = self.write('nodes.csv', 'id,label\na,A\nb,B\nc,C\n')
+        graph, _ = self.load(read_csv(edges, nodes))
+        self.assertEqual(graph.nodes['c'], {'label': 'C'})
+        self.assertEqual(graph.edges['0'], ['a', 'b', {'weight': 2.0, 'kind': 'x',
+                                                       'directed': True}])
+        graph, _ = self.load(read_csv(edges), directed=False)
+        self.assertEqual(sorted(graph.nodes), ['a', 'b', 'c'])
+        self.assertEqual(graph.edges['1'][2]['directed'], False)
+        
+    def test_edge_list_in_small_batches(self):
+        lines = ['# comment', ''] + ['n%d n%d %d' % (i, i + 1, i) for i in range(200)]
+        path = self.write('graph.txt', '\n'.join(lines) + '\n')
+        graph, flushes = self.load(read_edge_list(path), batch_bytes=256, flush_bytes=1024)
+        self.assertEqual(len(graph.nodes), 201)
+        self.assertEqual(len(graph.edges), 200)
+        self.assertEqual(graph.edges['199'], ['n199', 'n200', {'weight': 199.0,
+                                                               'directed': True}])
+        self.assertTrue(len(flushes) > 1)
+        self.assertEqual(flushes[-1][:2], (201, 200))
+
+if __name__ == '__main__':
+    unittest.main()
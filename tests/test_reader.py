@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from pygephi.client import GephiFileHandler
+from pygephi.reader import GraphStreamReader, GraphEvent, StreamGraph
+
+class GraphStreamReaderTest(unittest.TestCase):
+    
+    def test_lines_split_between_reads(self):
+        reader = GraphStreamReader()
+        self.assertEqual(reader.feed('{"an":{"a":{}}}\r\n{"an":'), [GraphEvent('an', 'a', {}, None)])
+        self.assertEqual(reader.feed('{"b":{"size":2}}}'), [])
+        self.assertEqual(reader.close(), [GraphEvent('an', 'b', {'size': 2}, None)])
+        
+    def test_events_are_split_per_entity(self):
+        reader = GraphStreamReader()
+        events = reader.feed('{"de":{"e1":{},"e2":{}},"t":5}\n{"dn":{"filter":"ALL"}}\n')
+        self.assertEqual(sorted(events[:2]), [GraphEvent('de', 'e1', {}, 5),
+                                              GraphEvent('de', 'e2', {}, 5)])
+        self.assertEqual(events[2], GraphEvent('dn', None, {'filter': 'ALL'}, None))
+        
+    def test_malformed_lines(self):
+        reader = GraphStreamReader()
+        self.assertEqual(reader.feed('not json\r[1]\r{"an":{"a":{}}}\r'),
+                         [GraphEvent('an', 'a', {}, None)])
+        self.assertEqual(reader.errors, 2)
+        self.assertRaises(ValueError, GraphStreamReader(strict=True).feed, 'not json\n')
+        
+    def test_batches(self):
+        data = ''.join('{"an":{"n%d":{}}}\r\n' % i for i in range(5))
+        # a file is read in chunks of read_size bytes, split in batch_size events
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.seek(0)
+            batches = list(GraphStreamReader(f, batch_size=2).batches())
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        # other file-like objects are read line by line
+        batches = list(GraphStreamReader(StringIO(data), batch_size=2).batches())
+        self.assertEqual([len(batch) for batch in batches], [1]*5)
+        self.assertEqual([event.id for event in GraphStreamReader(StringIO(data))],
+                         ['n0', 'n1', 'n2', 'n3', 'n4'])
+
+class StreamGraphTest(unittest.TestCase):
+    
+    def test_round_trip(self):
+        out = StringIO()
+        client = GephiFileHandler(out, autoflush=False)
+        client.add_node('a', label='A')
+        client.add_node('b')
+        client.add_edge('e1', 'a', 'b', weight=2.0)
+        client.add_edge('e2', 'b', 'c')
+        client.change_node('b', size=3)
+        client.change_edge('e1', weight=4.0)
+        client.delete_node('c')
+        client.flush()
+        graph = StreamGraph()
+        graph.apply_batch(GraphStreamReader(StringIO(out.getvalue())))
+        self.assertEqual(graph.nodes, {'a': {'label': 'A'}, 'b': {'size': 3}})
+        self.assertEqual(graph.edges, {'e1': ['a', 'b', {'weight': 4.0, 'directed': True}]})
+        self.assertEqual(graph.incident, {'a': set(['e1']), 'b': set(['e1'])})
+        
+    def test_clean(self):
+        graph = StreamGraph()
+        reader = GraphStreamReader()
+        graph.apply_batch(reader.feed('{"ae":{"e1":{"source":"a","target":"b"}}}\n'))
+        self.assertEqual(sorted(graph.nodes), ['a', 'b'])
+        graph.apply_batch(reader.feed('{"dn":{"filter":"ALL"}}\n'))
+        self.assertEqual((graph.nodes, graph.edges, graph.incident), ({}, {}, {}))
+
+if __name__ == '__main__':
+    unittest.main()
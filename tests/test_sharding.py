@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# coding: utf-8
+#
+# Copyright (C) 2012 André Panisson
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+from pygephi.sharding import ShardedGephiClient, ShardError, hash_partition
+
+class FakeShard(object):
+    
+    def __init__(self):
+        self.down = False
+        self.received = []
+        
+    def _send(self, data):
+        if self.down:
+            raise IOError('down')
+        self.received.append(data)
+        
+    def events(self):
+        return [json.loads(line) for data in self.received
+                for line in data.split('\r\n') if line]
+
+def by_letter(node_id, shards):
+    return 0 if node_id < 'm' else 1
+
+class PartitionTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.shards = [FakeShard(), FakeShard()]
+        self.client = ShardedGephiClient(self.shards, mode='partition', partition=by_letter)
+        
+    def test_nodes_go_to_their_shard(self):
+        self.client.add_node('a', label='A')
+        self.client.add_node('z')
+        self.client.flush()
+        self.assertEqual(self.shards[0].events(), [{'an': {'a': {'label': 'A'}}}])
+        self.assertEqual(self.shards[1].events(), [{'an': {'z': {}}}])
+        
+    def test_cross_shard_edge_adds_ghosts(self):
+        self.client.add_edge('e1', 'a', 'z')
+        self.client.flush()
+        for shard, ghost in ((0, 'z'), (1, 'a')):
+            events = self.shards[shard].events()
+            self.assertEqual(events[0], {'an': {ghost: {'ghost': True}}})
+            self.assertEqual(events[1]['ae']['e1']['source'], 'a')
+            
+    def test_delete_node_deletes_ghosts(self):
+        self.client.add_edge('e1', 'a', 'z')
+        self.client.flush()
+        self.client.delete_node('a')
+        self.client.flush()
+        self.assertEqual(self.shards[0].events()[-1], {'dn': {'a': {}}})
+        self.assertEqual(self.shards[1].events()[-1], {'dn': {'a': {}}})
+        self.assertEqual(self.client.edge_shards, {})
+        self.assertEqual(self.client.node_edges, {})
+        
+    def test_change_edge_follows_its_shards(self):
+        self.client.add_edge('e1', 'a', 'b')
+        self.client.change_edge('e1', weight=2.0)
+        self.client.flush()
+        self.assertEqual(self.shards[0].events()[-1], {'ce': {'e1': {'weight': 2.0}}})
+        self.assertEqual(self.shards[1].received, [])
+        
+    def test_unicode_and_int_ids(self):
+        self.assertEqual(hash_partition(u'caf\xe9', 4), hash_partition('caf\xc3\xa9', 4))
+        self.client.partition = hash_partition
+        self.client.add_node(1)
+        self.client.add_node(u'caf\xe9')
+        self.client.flush()
+        ids = set()
+        for shard in self.shards:
+            for event in shard.events():
+                ids.update(event['an'])
+        self.assertEqual(ids, set([u'1', u'caf\xe9']))
+
+class FailureTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.shards = [FakeShard(), FakeShard()]
+        
+    def test_failing_shard_keeps_its_backlog(self):
+        client = ShardedGephiClient(self.shards)
+        self.shards[1].down = True
+        client.add_node('a')
+        try:
+            client.flush()
+        except ShardError, e:
+            self.assertEqual(e.errors.keys(), [1])
+            self.assertEqual(e.pending[1], client.pending(1))
+        else:
+            self.fail('ShardError not raised')
+        # still failing: not raised again, the other shard goes on
+        client.add_node('b')
+        client.flush()
+        self.assertEqual(len(self.shards[0].received), 2)
+        self.shards[1].down = False
+        client.flush()
+        self.assertEqual(client.pending(1), 0)
+        nodes = [node_id for event in self.shards[1].events() for node_id in event['an']]
+        self.assertEqual(nodes, ['a', 'b'])
+        
+    def test_backlog_is_bounded(self):
+        client = ShardedGephiClient(self.shards, max_pending=100)
+        self.shards[0].down = True
+        client.add_node('a')
+        self.assertRaises(ShardError, client.flush)
+        client.add_node('b', label='x'*100)
+        try:
+            client.flush()
+        except ShardError, e:
+            self.assertEqual(e.pending[0], 0)
+            self.assertTrue(e.dropped[0] > 100)
+        else:
+            self.fail('ShardError not raised')
+        self.assertEqual(client.pending(0), 0)
+
+if __name__ == '__main__':
+    unittest.main()